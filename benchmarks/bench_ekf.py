@@ -0,0 +1,84 @@
+"""
+Microbenchmark for Locator_EKF.update_state.
+
+Runs the same random measurement sequence through every engine, reports
+updates per second and the largest pose difference against the 'matrix'
+reference engine.
+
+Also times Locator_EKF_Bank advancing a fleet of robots in one call per
+tick, reported as robot updates per second, and Locator_EKF.filter_batch
+over a recorded log with and without RTS smoothing.
+
+Usage: python benchmarks/bench_ekf.py [n_updates] [n_robots]
+"""
+import os
+import sys
+from time import perf_counter
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from eBotAPI.Locator_EKF import Locator_EKF, Locator_EKF_Bank, ENGINES
+
+
+def make_inputs(n, seed=0):
+    rng = np.random.default_rng(seed)
+    data = np.column_stack([rng.uniform(-np.pi, np.pi, n),
+                            rng.uniform(-0.3, 0.3, n),
+                            rng.uniform(-0.3, 0.3, n)]).tolist()
+    Ts = rng.uniform(0.005, 0.05, n).tolist()
+    return data, Ts
+
+
+def run(engine, data, Ts):
+    ekf = Locator_EKF((0., 0.), 0., 0.1, engine=engine)
+    out = []
+    t0 = perf_counter()
+    for d, ts in zip(data, Ts):
+        out.append(ekf.update_state(d, ts))
+    elapsed = perf_counter() - t0
+    return np.array(out, dtype=float), len(data) / elapsed
+
+
+def run_bank(n_robots, n_ticks, seed=0):
+    rng = np.random.default_rng(seed)
+    data = rng.uniform(-0.3, 0.3, (n_ticks, n_robots, 3))
+    Ts = rng.uniform(0.005, 0.05, (n_ticks, n_robots))
+    bank = Locator_EKF_Bank(np.zeros((n_robots, 2)), 0.)
+    t0 = perf_counter()
+    for k in range(n_ticks):
+        bank.update_state(data[k], Ts[k])
+    elapsed = perf_counter() - t0
+    return n_robots * n_ticks / elapsed
+
+
+def run_batch(data, Ts, smooth):
+    rows = np.column_stack([np.array(data), np.array(Ts)])
+    ekf = Locator_EKF((0., 0.), 0., 0.1)
+    t0 = perf_counter()
+    ekf.filter_batch(rows, smooth=smooth)
+    return len(rows) / (perf_counter() - t0)
+
+
+def main(n=20000, n_robots=64):
+    data, Ts = make_inputs(n)
+    ref = None
+    for engine in ENGINES:
+        poses, rate = run(engine, data, Ts)
+        if ref is None:
+            ref = poses
+        err = np.abs(poses - ref).max()
+        print("{:8s} {:10.0f} updates/s   max |dpose| = {:.2e}".format(
+            engine, rate, err))
+    rate = run_bank(n_robots, max(n // n_robots, 1))
+    print("bank     {:10.0f} robot updates/s ({:d} robots)".format(
+        rate, n_robots))
+    for smooth in (False, True):
+        rate = run_batch(data, Ts, smooth)
+        print("{:8s} {:10.0f} rows/s".format(
+            "rts" if smooth else "batch", rate))
+    return
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
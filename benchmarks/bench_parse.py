@@ -0,0 +1,48 @@
+"""
+Microbenchmark for telemetry frame parsing.
+
+Compares the original read_all path (decode, then a float() list
+comprehension over the str fields) with telemetry.parse_frame on raw
+bytes and with telemetry.parse_block on a block of buffered frames.
+
+Usage: python benchmarks/bench_parse.py [n_frames]
+"""
+import os
+import sys
+from timeit import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from eBotAPI.telemetry import parse_frame, parse_block, split_frames
+
+FRAME = (b'123456;812;-64;16388;-45;23;-120;1200;3000;250;800;1500;2000;'
+         b'120;-118;512;300;25;742;35\n')
+
+
+def listcomp(frames):
+    for frame in frames:
+        line = frame.decode()
+        [float(x) for x in line.rstrip('\n').split(";")]
+
+
+def per_frame(frames):
+    for frame in frames:
+        parse_frame(frame)
+
+
+def main(n=2000, repeat=20):
+    block = FRAME * n
+    frames = [f + b'\n' for f in split_frames(block)]
+    cases = [('listcomp', lambda: listcomp(frames)),
+             ('parse_frame', lambda: per_frame(frames)),
+             ('parse_block', lambda: parse_block(block))]
+    base = None
+    for name, fn in cases:
+        us = timeit(fn, number=repeat) / repeat / n * 1e6
+        if base is None:
+            base = us
+        print("{:12s} {:6.2f} us/frame  x{:.1f}".format(name, us, base / us))
+    return
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
@@ -0,0 +1,195 @@
+"""
+Benchmark suite for the telemetry pipeline.
+
+- micro: read_all (framing and parsing), update_all and
+  Locator_EKF.update_state, on in-memory frames.
+- throughput: highest simulator frame rate the update thread keeps up
+  with, i.e. before frames are dropped: at least 99% (--threshold) of
+  the frames sent must reach the pipeline, where read_all processes the
+  newest one and skips the older ones on purpose.
+- throughput_catch_up: the same with eBot(catch_up=True), where every
+  frame has to be processed instead of only the newest one.
+- latency: time from a frame being written by the simulator to the
+  updated position() being available.
+
+The simulator (eBotAPI.simulator, a local pty) stands in for the robot.
+Results are written as JSON so they can be compared between releases.
+
+Usage: python benchmarks/suite.py [-o results.json] [--quick]
+"""
+import argparse
+from contextlib import redirect_stdout
+import json
+import os
+import platform
+import sys
+from time import perf_counter, sleep
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from eBotAPI import eBot
+from eBotAPI.Locator_EKF import Locator_EKF, ENGINES
+from eBotAPI.simulator import Simulator
+
+FRAME = (b'123456;812;-64;16388;-45;23;-120;1200;3000;250;800;1500;2000;'
+         b'120;-118;512;300;25;742;35\n')
+
+
+class MemoryPort:
+    """
+    Stand-in for SafeSerial that returns the same chunk on every read.
+    """
+    def __init__(self, chunk):
+        self.chunk = chunk
+
+    def read_available(self):
+        return self.chunk
+
+    def write(self, message):
+        return len(message)
+
+
+def per_call(fn, n):
+    t0 = perf_counter()
+    for i in range(n):
+        fn()
+    return (perf_counter() - t0) / n
+
+
+def offline_bot(chunk):
+    bot = eBot(async_commands=False)
+    bot.port = MemoryPort(chunk)
+    bot.apply_offset([bot.read_all()])
+    return bot
+
+
+def bench_micro(n):
+    results = {}
+    for frames in (1, 10):
+        bot = offline_bot(FRAME * frames)
+        results['read_all_{}_frames_us'.format(frames)] = \
+            per_call(bot.read_all, n) * 1e6
+    bot = offline_bot(FRAME)
+    step = [123456.]
+
+    def update_all():
+        # Advance the time stamp so every call runs the full pipeline
+        step[0] += 10
+        bot.port.chunk = b'%d' % step[0] + FRAME[6:]
+        bot.update_all()
+    results['update_all_us'] = per_call(update_all, n) * 1e6
+    for engine in ENGINES:
+        ekf = Locator_EKF((0., 0.), 0., 0.1, engine=engine)
+        results['update_state_{}_us'.format(engine)] = per_call(
+            lambda: ekf.update_state((0.1, 0.2, 0.19), 0.01), n) * 1e6
+    return results
+
+
+def run_simulated(rate, duration, log_emissions=False, catch_up=False):
+    """
+    Connects an eBot to a simulator streaming at rate frames/s.
+    Latencies are only measured without catch_up.
+
+    :return: (frames sent, frame counts as eBot.frame_stats, latencies in
+        s, loop stats)
+    """
+    latencies = []
+    # eBot reports connection progress on stdout, keep it out of the JSON
+    with Simulator(rate=rate, log_emissions=log_emissions) as sim, \
+            redirect_stdout(sys.stderr):
+        bot = eBot(catch_up=catch_up)
+        bot.connect(port_path=sim.port_path)
+        process_frame = bot.process_frame
+        received = {}
+
+        def timed(data):
+            process_frame(data)
+            received[round(data[0], 3)] = perf_counter()
+        bot.process_frame = timed
+        sent0 = sim.frames_sent
+        counts0 = bot.frame_stats()
+        sleep(duration)
+        sent = sim.frames_sent - sent0
+        counts = bot.frame_stats()
+        counts = {name: counts[name] - counts0[name]
+                  for name in ('processed', 'skipped', 'bad', 'dropped')}
+        stats = bot.loop_stats()
+        bot.disconnect()
+        if log_emissions:
+            for stamp, emitted in sim.emissions:
+                if stamp in received:
+                    latencies.append(received[stamp] - emitted)
+    return sent, counts, latencies, stats
+
+
+def bench_throughput(rates, duration, threshold=0.99, catch_up=False):
+    """
+    received_ratio is the fraction of the frames sent that reached the
+    pipeline: processed, or skipped by read_all for a newer one. dropped
+    is the estimate of the frames lost before that from the time_stamp
+    gaps (see eBot.frame_stats).
+    """
+    results = {'rates': [], 'threshold': threshold, 'max_sustained_rate': 0.}
+    for rate in rates:
+        sent, counts, _, stats = run_simulated(rate, duration,
+                                               catch_up=catch_up)
+        received = counts['processed'] + counts['skipped']
+        ratio = received / sent if sent else 0.
+        results['rates'].append({'rate': rate, 'sent': sent,
+                                 'processed': counts['processed'],
+                                 'skipped': counts['skipped'],
+                                 'dropped': counts['dropped'],
+                                 'received_ratio': ratio,
+                                 'cpu_usage': stats['cpu_usage']})
+        if ratio >= threshold:
+            results['max_sustained_rate'] = rate
+        elif ratio < 0.5:
+            break
+    return results
+
+
+def bench_latency(rate, duration):
+    _, _, latencies, _ = run_simulated(rate, duration, log_emissions=True)
+    lat = np.array(latencies) * 1e3
+    if not len(lat):
+        return {'rate': rate, 'samples': 0}
+    return {'rate': rate, 'samples': len(lat),
+            'mean_ms': lat.mean(), 'p50_ms': np.percentile(lat, 50),
+            'p99_ms': np.percentile(lat, 99), 'max_ms': lat.max()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('-o', '--output', help='write the JSON here')
+    parser.add_argument('--quick', action='store_true',
+                        help='shorter runs, for smoke testing')
+    parser.add_argument('--threshold', type=float, default=0.99,
+                        help='fraction of the frames sent that must be '
+                        'received')
+    args = parser.parse_args(argv)
+    n = 2000 if args.quick else 20000
+    duration = 1. if args.quick else 3.
+    rates = (500, 2000) if args.quick else (250, 500, 1000, 2000, 4000,
+                                            8000, 16000)
+    results = {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'micro': bench_micro(n),
+        'throughput': bench_throughput(rates, duration, args.threshold),
+        'throughput_catch_up': bench_throughput(rates, duration,
+                                                args.threshold, True),
+        'latency': bench_latency(100, duration),
+    }
+    text = json.dumps(results, indent=2, default=float)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,47 @@
 #__author__ = 'Mohammadreza'
 import numpy as np
-from math import pi
-from time import *
+from math import pi, sin, cos, sqrt
+from time import perf_counter
+
+ENGINES = ('matrix', 'fast')
+
+
+def _chol3_inverse(s00, s10, s11, s20, s21, s22, sqrt=sqrt):
+    """
+    Cholesky factor S = L L^T of a symmetric 3 by 3 matrix and the entries
+    of its inverse Li = L^-1 = [[a, 0, 0], [b, d, 0], [g, e, f]].
+    Works element-wise on ndarrays when given np.sqrt.
+    """
+    l00 = sqrt(s00)
+    l10 = s10/l00
+    l20 = s20/l00
+    l11 = sqrt(s11 - l10*l10)
+    l21 = (s21 - l20*l10)/l11
+    l22 = sqrt(s22 - l20*l20 - l21*l21)
+    a = 1./l00
+    d = 1./l11
+    f = 1./l22
+    b = -l10*a*d
+    e = -l21*d*f
+    g = -(l20*a + l21*b)*f
+    return a, b, d, e, f, g
+
 
 class Locator_EKF:
-    def __init__(self, pos, heading, wheel_distance = 0.1):
+    def __init__(self, pos, heading, wheel_distance = 0.1, engine = 'matrix'):
+        """
+        :param pos: initial (x, y) position of the robot
+        :param heading: initial heading in radians
+        :param wheel_distance: distance between the wheels
+        :param engine: 'matrix' runs the reference np.matrix implementation,
+            'fast' updates preallocated arrays in place and solves the
+            3 by 3 measurement update in closed form. Both give the same
+            results.
+        """
+        if engine not in ENGINES:
+            raise ValueError("Unknown EKF engine: {}".format(engine))
+        self.engine = engine
+        self.stats = None # instrumentation.PipelineStats, when timing
         self.l = wheel_distance
         self.R = np.asmatrix( np.diag(np.array([1,1,1])) ) # The measurment covariance matrix
         self.Q = np.asmatrix( 0.01*np.identity(5) ) # Process covariance matrix
@@ -13,6 +50,22 @@ class Locator_EKF:
                             [0, 0, 0, 0, 1]])
         self.P = np.asmatrix( np.identity(5) ) # Initial covariance matrix
         self.x = np.matrix( [ [pos[0]] , [pos[1]] , [heading], [0.] , [0.] ])
+        if engine == 'fast':
+            self._init_fast()
+        return
+
+    def _init_fast(self):
+        # Plain ndarrays so that every product can be written in place
+        self.x = np.asarray(self.x, dtype=float).copy()
+        self.P = np.asarray(self.P, dtype=float).copy()
+        self._Q = np.asarray(self.Q, dtype=float).copy()
+        self._r = [float(self.R[i, i]) for i in range(3)]
+        self._A = np.identity(5)            # Jacobian, only 8 entries change
+        self._tmp55 = np.empty((5, 5))
+        self._M = np.empty((3, 3))          # (L^T L)^-1 for S = L L^T
+        self._K = np.empty((5, 3))
+        self._dz = np.empty((3, 1))
+        self._dx = np.empty((5, 1))
         return
 
     def get_position(self):
@@ -32,26 +85,37 @@ class Locator_EKF:
         :return: it returns updated x which is a vector of updated
         position and heading (x,y,theta) and the covariance matrix
         """
-        t1 = time()
+        stats = self.stats
+        if stats is None:
+            if self.engine == 'fast':
+                return self._update_state_fast(data, Ts)
+            return self._update_state_matrix(data, Ts)
+        t1 = perf_counter()
+        if self.engine == 'fast':
+            result = self._update_state_fast(data, Ts)
+        else:
+            result = self._update_state_matrix(data, Ts)
+        stats.record('update_state', perf_counter() - t1)
+        return result
+
+    def _update_state_matrix(self, data, Ts):
         z = np.matrix([ [data[0]] , [data[1]] , [data[2]] ])
-        x1 = np.array([[self.x[0] + Ts/2*(self.x[3]+self.x[4])*np.cos(self.x[2])],# Updates state
-                       [self.x[1] + Ts/2*(self.x[3]+self.x[4])*np.sin(self.x[2])],
-                       [self.x[2] + Ts/self.l*(self.x[3]-self.x[4])],
-                       [self.x[3]],
-                       [self.x[4]]])
-        x1 = np.asmatrix(x1)
-        x1 = np.transpose(x1)
-        A = np.matrix([[1, 0, -Ts/2*(x1[3]+x1[4])*np.sin(x1[2]),  Ts/2*np.cos(x1[2]),  Ts/2*np.cos(x1[2])], # Jacoobian
-                       [0, 1,  Ts/2*(x1[3]+x1[4])*np.cos(x1[2]),  Ts/2*np.sin(x1[2]),  Ts/2*np.sin(x1[2])],
+        x = self.x
+        x1 = np.matrix([[x[0,0] + Ts/2*(x[3,0]+x[4,0])*np.cos(x[2,0])],# Updates state
+                        [x[1,0] + Ts/2*(x[3,0]+x[4,0])*np.sin(x[2,0])],
+                        [x[2,0] + Ts/self.l*(x[3,0]-x[4,0])],
+                        [x[3,0]],
+                        [x[4,0]]])
+        A = np.matrix([[1, 0, -Ts/2*(x1[3,0]+x1[4,0])*np.sin(x1[2,0]),  Ts/2*np.cos(x1[2,0]),  Ts/2*np.cos(x1[2,0])], # Jacoobian
+                       [0, 1,  Ts/2*(x1[3,0]+x1[4,0])*np.cos(x1[2,0]),  Ts/2*np.sin(x1[2,0]),  Ts/2*np.sin(x1[2,0])],
                        [0, 0,  1,                                                Ts/self.l,               -Ts/self.l],
                        [0, 0,  0,                                                1,                        0],
                        [0, 0,  0,                                                0,                        1]])
         self.P = A*self.P*A.T+self.Q
-        z1 = np.array([[x1[2]],
-                       [x1[3]],
-                       [x1[4]]])
+        z1 = np.array([[x1[2,0]],
+                       [x1[3,0]],
+                       [x1[4,0]]])
         z1 = np.asmatrix(z1)
-        z1 = z1.T
         P12 = self.P*self.H.T
 
         R = np.linalg.cholesky(self.H*P12+self.R)
@@ -59,3 +123,238 @@ class Locator_EKF:
         self.x = x1 + U *( R.T.I*(z-z1) )
         self.P = self.P-U*U.T
         return self.x[0,0] , self.x[1,0] , self.x[2,0]
+
+    def _update_state_fast(self, data, Ts):
+        """
+        Same filter as the 'matrix' engine of update_state, written on
+        preallocated arrays. H only selects the last three states, so the
+        innovation covariance is a 3 by 3 block of P and its Cholesky
+        factor and inverse are computed with scalar arithmetic.
+        """
+        self._predict_fast(Ts)
+        self._correct_fast(data)
+        x = self.x
+        return float(x[0, 0]), float(x[1, 0]), float(x[2, 0])
+
+    def _predict_fast(self, Ts):
+        x = self.x
+        P = self.P
+        A = self._A
+        tmp = self._tmp55
+        vr = float(x[3, 0])
+        vl = float(x[4, 0])
+        v = Ts/2*(vr+vl)
+        th = float(x[2, 0])
+        # Updates state
+        x[0, 0] += v*cos(th)
+        x[1, 0] += v*sin(th)
+        th += Ts/self.l*(vr-vl)
+        x[2, 0] = th
+        # Jacobian evaluated on the predicted state
+        c = Ts/2*cos(th)
+        s = Ts/2*sin(th)
+        A[0, 2] = -v*sin(th)
+        A[1, 2] = v*cos(th)
+        A[0, 3] = A[0, 4] = c
+        A[1, 3] = A[1, 4] = s
+        A[2, 3] = Ts/self.l
+        A[2, 4] = -Ts/self.l
+        np.dot(A, P, out=tmp)
+        np.dot(tmp, A.T, out=P)
+        P += self._Q
+        return
+
+    def _correct_fast(self, data):
+        x = self.x
+        P = self.P
+        tmp = self._tmp55
+        # Innovation covariance S = H P H^T + R = L L^T
+        s00 = P[2, 2] + self._r[0]
+        s10 = P[3, 2]
+        s11 = P[3, 3] + self._r[1]
+        s20 = P[4, 2]
+        s21 = P[4, 3]
+        s22 = P[4, 4] + self._r[2]
+        a, b, d, e, f, g = _chol3_inverse(s00, s10, s11, s20, s21, s22, sqrt)
+        # M = Li Li^T = (L^T L)^-1, matching U = P12 L^-1, x += U L^-T dz
+        M = self._M
+        M[0, 0] = a*a
+        M[0, 1] = M[1, 0] = a*b
+        M[0, 2] = M[2, 0] = a*g
+        M[1, 1] = b*b + d*d
+        M[1, 2] = M[2, 1] = b*g + d*e
+        M[2, 2] = g*g + e*e + f*f
+        P12 = P[:, 2:]
+        K = self._K
+        np.dot(P12, M, out=K)
+        dz = self._dz
+        dz[0, 0] = data[0] - x[2, 0]
+        dz[1, 0] = data[1] - x[3, 0]
+        dz[2, 0] = data[2] - x[4, 0]
+        np.dot(K, dz, out=self._dx)
+        np.dot(K, P12.T, out=tmp)
+        x += self._dx
+        P -= tmp
+        return
+
+    def filter_batch(self, rows, smooth=False):
+        """
+        Runs the filter over a whole recording in one pass, starting from
+        the current state. Afterwards the filter is left in the same state
+        as if update_state had been called once per row.
+
+        :param rows: (N,4) array of [heading, right wheel speed, left wheel
+            speed, Ts] rows, in the same units as update_state's data and Ts
+        :param smooth: if True, a Rauch-Tung-Striebel backward pass is run
+            over the filtered history and the smoothed poses are returned
+        :return: (N,3) array with the (x, y, theta) after every row
+        """
+        rows = np.asarray(rows, dtype=float)
+        n = len(rows)
+        if self.engine == 'fast':
+            ekf = self
+        else:
+            ekf = Locator_EKF((0., 0.), 0., self.l, engine='fast')
+            ekf.x[:] = self.x
+            ekf.P[:] = self.P
+        x = ekf.x
+        P = ekf.P
+        # Preallocated history
+        xf = np.empty((n, 5))
+        if smooth:
+            xp = np.empty((n, 5))
+            Pf = np.empty((n, 5, 5))
+            Pp = np.empty((n, 5, 5))
+            A = np.empty((n, 5, 5))
+        for k, (h, vr, vl, Ts) in enumerate(rows.tolist()):
+            ekf._predict_fast(Ts)
+            if smooth:
+                xp[k] = x[:, 0]
+                Pp[k] = P
+                A[k] = ekf._A
+            ekf._correct_fast((h, vr, vl))
+            xf[k] = x[:, 0]
+            if smooth:
+                Pf[k] = P
+        if ekf is not self:
+            self.x = np.asmatrix(ekf.x)
+            self.P = np.asmatrix(ekf.P)
+        if not smooth or n < 2:
+            return xf[:, :3]
+        # Smoother gains C_k = Pf_k A_{k+1}^T Pp_{k+1}^-1, all at once.
+        # Pp is symmetric, so C_k^T = Pp_{k+1}^-1 A_{k+1} Pf_k.
+        C = np.linalg.solve(Pp[1:], A[1:] @ Pf[:-1]).transpose(0, 2, 1)
+        xs = xf
+        for k in range(n - 2, -1, -1):
+            xs[k] += C[k] @ (xs[k + 1] - xp[k + 1])
+        return xs[:, :3]
+
+
+class Locator_EKF_Bank:
+    """
+    N independent Locator_EKF filters advanced together. States are kept
+    as an (N,5) array and covariances as an (N,5,5) array, so one call to
+    update_state runs the predict/update of the whole fleet with a few
+    batched NumPy operations. Each row follows exactly the same filter as
+    Locator_EKF.
+    """
+    def __init__(self, pos, heading, wheel_distance = 0.1):
+        """
+        :param pos: (N,2) initial positions
+        :param heading: (N,) initial headings in radians, or a scalar
+        :param wheel_distance: distance between the wheels (shared)
+        """
+        pos = np.asarray(pos, dtype=float).reshape(-1, 2)
+        n = len(pos)
+        self.n = n
+        self.l = wheel_distance
+        self.R = np.array([1., 1., 1.]) # Diagonal of the measurment covariance
+        self.Q = 0.01*np.identity(5) # Process covariance matrix
+        self.P = np.tile(np.identity(5), (n, 1, 1))
+        self.x = np.zeros((n, 5))
+        self.x[:, :2] = pos
+        self.x[:, 2] = heading
+        self._A = np.tile(np.identity(5), (n, 1, 1))
+        self._tmp = np.empty((n, 5, 5))
+        self._M = np.empty((n, 3, 3))
+        self._K = np.empty((n, 5, 3))
+        self._dz = np.empty((n, 3, 1))
+        self._dx = np.empty((n, 5, 1))
+        return
+
+    def __len__(self):
+        return self.n
+
+    def get_positions(self):
+        return self.x[:, :2]
+
+    def get_headings(self):
+        return self.x[:, 2]
+
+    def update_state(self, data, Ts, mask=None):
+        """
+        :param data: (N,3) measurements, one row per robot as in
+            Locator_EKF.update_state
+        :param Ts: (N,) sampling times, or a scalar shared by all robots
+        :param mask: optional (N,) boolean array. Only the selected robots
+            are updated, the others keep their state and covariance.
+            data and Ts are still given for all N robots.
+        :return: (N,3) view on the (x, y, theta) of every robot
+        """
+        data = np.asarray(data, dtype=float)
+        Ts = np.broadcast_to(np.asarray(Ts, dtype=float), (self.n,))
+        if mask is None:
+            self._update(self.x, self.P, data, Ts, self._A, self._tmp,
+                         self._M, self._K, self._dz, self._dx)
+        else:
+            idx = np.flatnonzero(mask)
+            x = self.x[idx]
+            P = self.P[idx]
+            m = len(idx)
+            A = np.tile(np.identity(5), (m, 1, 1))
+            self._update(x, P, data[idx], Ts[idx], A, np.empty((m, 5, 5)),
+                         np.empty((m, 3, 3)), np.empty((m, 5, 3)),
+                         np.empty((m, 3, 1)), np.empty((m, 5, 1)))
+            self.x[idx] = x
+            self.P[idx] = P
+        return self.x[:, :3]
+
+    def _update(self, x, P, data, Ts, A, tmp, M, K, dz, dx):
+        vr = x[:, 3].copy()
+        vl = x[:, 4].copy()
+        v = Ts/2*(vr+vl)
+        th = x[:, 2]
+        # Updates state
+        x[:, 0] += v*np.cos(th)
+        x[:, 1] += v*np.sin(th)
+        th += Ts/self.l*(vr-vl)
+        # Jacobian evaluated on the predicted state
+        c = Ts/2*np.cos(th)
+        s = Ts/2*np.sin(th)
+        A[:, 0, 2] = -v*np.sin(th)
+        A[:, 1, 2] = v*np.cos(th)
+        A[:, 0, 3] = A[:, 0, 4] = c
+        A[:, 1, 3] = A[:, 1, 4] = s
+        A[:, 2, 3] = Ts/self.l
+        A[:, 2, 4] = -Ts/self.l
+        np.matmul(A, P, out=tmp)
+        np.matmul(tmp, A.transpose(0, 2, 1), out=P)
+        P += self.Q
+        a, b, d, e, f, g = _chol3_inverse(P[:, 2, 2] + self.R[0], P[:, 3, 2],
+                                          P[:, 3, 3] + self.R[1], P[:, 4, 2],
+                                          P[:, 4, 3], P[:, 4, 4] + self.R[2],
+                                          np.sqrt)
+        M[:, 0, 0] = a*a
+        M[:, 0, 1] = M[:, 1, 0] = a*b
+        M[:, 0, 2] = M[:, 2, 0] = a*g
+        M[:, 1, 1] = b*b + d*d
+        M[:, 1, 2] = M[:, 2, 1] = b*g + d*e
+        M[:, 2, 2] = g*g + e*e + f*f
+        P12 = P[:, :, 2:]
+        np.matmul(P12, M, out=K)
+        np.subtract(data, x[:, 2:], out=dz[:, :, 0])
+        np.matmul(K, dz, out=dx)
+        np.matmul(K, P12.transpose(0, 2, 1), out=tmp)
+        x += dx[:, :, 0]
+        P -= tmp
+        return
@@ -1,3 +1,5 @@
 from .eBot import eBot
+from .aio import AsyncEBot
+from .fleet import Fleet
 
-__all__ = ['eBot']
+__all__ = ['eBot', 'AsyncEBot', 'Fleet']
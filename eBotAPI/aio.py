@@ -0,0 +1,329 @@
+"""
+asyncio client for the eBot.
+
+AsyncEBot drives one robot from an event loop without any thread of its
+own: telemetry is read when the port descriptor becomes readable (through
+loop.add_reader) and commands are written by a task, so a single loop can
+serve many robots. Framing, parsing, localization and the getters are the
+ones of eBot, which AsyncEBot wraps.
+"""
+import asyncio
+from threading import get_ident
+from time import perf_counter
+
+from .commands import CommandQueue
+from .eBot import eBot, SafeSerial, handshake_steps, probe_steps
+
+BAUD_RATE = 115200
+
+
+class AsyncCommandWriter(CommandQueue):
+    """
+    asyncio counterpart of commands.CommandWriter: same queueing, spacing
+    and coalescing rules, written from a task on the event loop.
+    """
+    def __init__(self, port, spacing=0.05):
+        CommandQueue.__init__(self, port, spacing)
+        self.written = 0   # sequence number of the last written command
+        self.wakeup = asyncio.Event()
+        self.progress = asyncio.Condition()
+        self.task = None
+        self.loop = None
+        self.loop_thread = None
+        return
+
+    def start(self):
+        self.loop = asyncio.get_running_loop()
+        self.loop_thread = get_ident()
+        self.task = asyncio.ensure_future(self.run())
+        return
+
+    async def stop(self, flush=True):
+        if flush:
+            await self.flush()
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        return
+
+    def send(self, message, key=None):
+        if self.loop_thread != get_ident() and self.loop is not None:
+            # e.g. a motion timeout or a threaded subscriber
+            self.loop.call_soon_threadsafe(self.send, message, key)
+            return
+        if self.enqueue(message, key):
+            self.wakeup.set()
+        return
+
+    async def flush(self):
+        """
+        Waits until every command queued so far has been written.
+        """
+        target = self.queued
+        async with self.progress:
+            await self.progress.wait_for(
+                lambda: self.written >= target or self.error is not None)
+        if self.error is not None:
+            raise self.error
+        return
+
+    async def run(self):
+        last_write = -self.spacing
+        while True:
+            if not self.queue:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                continue
+            delay = last_write + self.spacing - perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            key, message, seq, enqueued = self.dequeue()
+            try:
+                self.port.write(message)
+            except Exception as ex:
+                self.error = ex
+                self.clear()
+            if self.error is None:
+                last_write = self.record_write(enqueued)
+            else:
+                last_write = perf_counter()
+            async with self.progress:
+                self.written = seq
+                self.progress.notify_all()
+            if self.error is not None:
+                return
+
+
+async def run_steps_async(steps):
+    """
+    Runs an eBot.handshake_steps or eBot.probe_steps generator without
+    blocking the event loop.
+
+    :return: the result of the generator
+    """
+    try:
+        wait = next(steps)
+        while True:
+            await asyncio.sleep(min(wait, 0.005))
+            wait = next(steps)
+    except StopIteration as done:
+        return done.value
+
+
+class AsyncEBot:
+    def __init__(self, pos=(0., 0.), heading=0., history_size=4096,
+                 queue_size=64, calibration_cache=None, catch_up=False):
+        """
+        :param queue_size: frames buffered for each telemetry() consumer;
+            when a consumer falls behind its oldest frames are dropped.
+        :param calibration_cache: see eBot
+        :param catch_up: see eBot; consumers then get one Snapshot per
+            block of frames processed together.
+        """
+        self.bot = eBot(pos, heading, history_size=history_size,
+                        async_commands=False,
+                        calibration_cache=calibration_cache,
+                        catch_up=catch_up)
+        self.port = None
+        self.writer = None
+        self.queue_size = queue_size
+        self.subscribers = []
+        self.ready = None
+        self.poll_task = None
+        self.error = None  # exception that stopped the telemetry
+        return
+
+    def __getattr__(self, name):
+        # Getters and state (position, robot_uS, history, snapshot, ...)
+        if name == 'bot':
+            raise AttributeError(name)
+        return getattr(self.bot, name)
+
+    async def connect(self, port_path=None, strikes=40, timeout=5.):
+        """
+        Opens the connection with the first port that answers as an eBot
+        and waits until the first frame has been processed.
+
+        :param timeout: maximum wait for the first frame once the robot
+            has answered, in seconds
+        :raise Exception: No eBot found, or the error that stopped the
+            processing of the first frames
+        """
+        loop = asyncio.get_running_loop()
+        t0 = perf_counter()
+        ports = self.bot.candidate_ports(port_path)
+        probes = [asyncio.ensure_future(self._probe(port, strikes))
+                  for port in ports]
+        port = None
+        try:
+            for probe in asyncio.as_completed(probes):
+                port = await probe
+                if port is not None:
+                    break
+        finally:
+            for probe in probes:
+                probe.cancel()
+            found = await asyncio.gather(*probes, return_exceptions=True)
+            for other in found:
+                if isinstance(other, SafeSerial) and other is not port:
+                    other.close()
+        if port is None:
+            raise Exception("No eBot found")
+        self.port = port
+        self.bot.port = port
+        port.stats = self.bot.pipeline_stats
+        self.bot.portName = port.port
+        self.bot.connect_times = {'probe': perf_counter() - t0}
+        self.bot.use_calibration_cache(port.port)
+        await self._handshake()
+        self.bot.connect_times['time_to_ready'] = perf_counter() - t0
+        self.writer = AsyncCommandWriter(port, self.bot.command_spacing)
+        self.writer.start()
+        self.bot.writer = self.writer
+        self.bot.serialReady = True
+        self.ready = asyncio.Event()
+        self.error = None
+        fd = getattr(port, 'fd', None)
+        if fd is not None:
+            loop.add_reader(fd, self._on_readable)
+        else:
+            self.poll_task = asyncio.ensure_future(self._poll())
+        try:
+            await asyncio.wait_for(self.ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            await self._close(flush=False)
+            raise Exception("No eBot found")
+        if self.error is not None:
+            await self._close(flush=False)
+            raise self.error
+        return
+
+    async def _probe(self, port_name, strikes):
+        try:
+            port = SafeSerial(port_name, BAUD_RATE, timeout=0,
+                              writeTimeout=5.0)
+        except Exception:
+            return None
+        try:
+            if await run_steps_async(probe_steps(port, strikes)):
+                return port
+        except asyncio.CancelledError:
+            port.close()
+            raise
+        except Exception:
+            pass
+        port.close()
+        return None
+
+    async def _handshake(self):
+        bot = self.bot
+        if not await run_steps_async(handshake_steps(self.port,
+                                                     bot.connect_times)):
+            bot.lostConnection()
+        bot.reader.clear()
+        bot.clock.reset()
+        return
+
+    async def _poll(self):
+        # Fallback for ports without a pollable descriptor
+        while True:
+            self._on_readable()
+            await asyncio.sleep(0.005)
+
+    def _on_readable(self):
+        bot = self.bot
+        try:
+            if not bot.update_all():
+                return
+        except Exception as ex:
+            # Reading stops; telemetry() consumers get the error.
+            bot._fail(ex)
+            self.error = ex
+            self._stop_reading()
+            self.ready.set()
+            self._publish(ex)
+            return
+        self.ready.set()
+        self._publish(bot.snapshot)
+        return
+
+    def _publish(self, item):
+        for queue in self.subscribers:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(item)
+        return
+
+    def _stop_reading(self):
+        if self.poll_task is not None:
+            self.poll_task.cancel()
+            self.poll_task = None
+            return
+        fd = getattr(self.port, 'fd', None)
+        if fd is not None:
+            asyncio.get_running_loop().remove_reader(fd)
+        return
+
+    async def telemetry(self):
+        """
+        Asynchronous stream of Snapshots, one per processed frame.
+
+        Usage: async for frame in bot.telemetry(): ...
+
+        :raise Exception: the error that stopped the telemetry
+        """
+        queue = asyncio.Queue(self.queue_size)
+        self.subscribers.append(queue)
+        try:
+            while True:
+                item = await queue.get()
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            self.subscribers.remove(queue)
+
+    async def disconnect(self):
+        """
+        Stops the robot, flushes the pending commands and closes the port.
+        """
+        if self.port is None:
+            return
+        self._stop_reading()
+        self.bot.stop_pipeline()
+        self.bot.halt()
+        await self._close()
+        return
+
+    async def _close(self, flush=True):
+        self._stop_reading()
+        await self.writer.stop(flush)
+        self.bot.writer = None
+        self.bot.serialReady = False
+        self.port.close()
+        self.port = None
+        return
+
+    close = disconnect
+
+    def command_stats(self):
+        return None if self.writer is None else self.writer.stats()
+
+
+def _command(name):
+    async def command(self, *args):
+        getattr(self.bot, name)(*args)
+        await self.writer.flush()
+    command.__name__ = name
+    command.__doc__ = getattr(eBot, name).__doc__
+    return command
+
+
+# Awaitable commands: they return once the command has been written
+for _name in ('halt', 'led', 'led_on', 'led_off', 'imperial_march', 'buzzer',
+              'wheels', 'calibration'):
+    setattr(AsyncEBot, _name, _command(_name))
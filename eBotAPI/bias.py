@@ -0,0 +1,163 @@
+"""
+Online estimation of the accelerometer and gyroscope offsets.
+
+The offsets are the readings of Ax, Ay, Az, Gx, Gy and Gz with the robot
+at rest. BiasEstimator keeps a running (Welford) mean and variance per
+axis, fed with every frame received while the robot is stationary, so a
+provisional estimate is available from the first frame and improves as
+data arrives. Once memory samples have been accumulated older samples are
+progressively forgotten, which lets the estimate follow a slow drift of
+the sensors each time the robot stops.
+
+The robot is considered stationary when both wheel encoders read zero
+and the gyro Gz reading is within gyro_threshold of its offset. Frames
+right after the robot stops are skipped (settle) so the deceleration does
+not pollute the estimate.
+"""
+from math import sqrt
+
+AXES = ('Ax', 'Ay', 'Az', 'Gx', 'Gy', 'Gz')
+
+
+class BiasEstimator:
+    def __init__(self, min_samples=100, memory=2000, settle=20,
+                 gyro_threshold=50., encoder_threshold=0.):
+        """
+        :param min_samples: samples needed to consider the estimate
+            converged
+        :param memory: number of samples after which older samples start
+            to be forgotten
+        :param settle: stationary frames skipped after the robot stops
+        :param gyro_threshold: max |Gz - offset| of a stationary frame
+            (raw units; same as the gyro noise gate of eBot)
+        :param encoder_threshold: max |encoder| of a stationary frame
+        """
+        self.min_samples = min_samples
+        self.memory = memory
+        self.settle = settle
+        self.gyro_threshold = gyro_threshold
+        self.encoder_threshold = encoder_threshold
+        self.reset()
+        return
+
+    def reset(self):
+        """
+        Forgets the estimate. The robot is assumed to be at rest until it
+        is first seen moving.
+        """
+        self.count = 0  # samples in the estimate, capped at memory
+        self.samples = 0  # stationary frames used since reset
+        self.mean = [0.] * len(AXES)
+        self.m2 = [0.] * len(AXES)
+        self.still = self.settle  # consecutive stationary frames
+        self.stationary = True
+        return
+
+    @property
+    def ready(self):
+        """
+        True once an estimate is available (possibly provisional).
+        """
+        return self.count > 0
+
+    @property
+    def converged(self):
+        return self.samples >= self.min_samples
+
+    def is_stationary(self, data):
+        """
+        :param data: the 20 values of a frame
+        """
+        threshold = self.encoder_threshold
+        if abs(data[13]) > threshold or abs(data[14]) > threshold:
+            return False
+        return (self.count == 0 or
+                abs(data[6] - self.mean[5]) <= self.gyro_threshold)
+
+    def update(self, data):
+        """
+        Feeds one frame; it only contributes to the estimate if the robot
+        is stationary.
+
+        :param data: the 20 values of a frame
+        :rtype: bool
+        :return: True if the frame was used
+        """
+        self.stationary = self.is_stationary(data)
+        if not self.stationary:
+            self.still = 0
+            return False
+        if self.still < self.settle:
+            self.still += 1
+            return False
+        self.add(data[1:7])
+        return True
+
+    def add(self, values):
+        """
+        Adds one sample known to be taken at rest.
+
+        :param values: Ax, Ay, Az, Gx, Gy, Gz
+        """
+        if self.count < self.memory:
+            self.count += 1
+        self.samples += 1
+        n = self.count
+        mean = self.mean
+        m2 = self.m2
+        for i, v in enumerate(values):
+            delta = v - mean[i]
+            mean[i] += delta / n
+            m2[i] += delta * (v - mean[i])
+            if n == self.memory:
+                # Keep the variance on the same window as the mean
+                m2[i] *= (n - 1.) / n
+        return
+
+    def seed(self, offsets, std=None, samples=None):
+        """
+        Replaces the estimate with one computed earlier (e.g. cached), as
+        if it came from samples frames at rest.
+
+        :param offsets: Ax, Ay, Az, Gx, Gy, Gz offsets
+        :param std: standard deviation of each axis, zeros if None
+        :param samples: min_samples if None, so the estimate is converged
+        """
+        if samples is None:
+            samples = self.min_samples
+        self.samples = samples
+        self.count = min(max(samples, 1), self.memory)
+        self.mean = [float(v) for v in offsets]
+        if std is None:
+            std = (0.,) * len(AXES)
+        self.m2 = [v * v * (self.count - 1) for v in std]
+        return
+
+    def offsets(self):
+        """
+        :rtype: tuple
+        :return: Ax, Ay, Az, Gx, Gy, Gz offsets (zeros until a sample has
+            been taken at rest)
+        """
+        return tuple(self.mean)
+
+    def variance(self):
+        """
+        :rtype: tuple
+        :return: sample variance of each axis
+        """
+        if self.count < 2:
+            return (0.,) * len(AXES)
+        return tuple([v / (self.count - 1) for v in self.m2])
+
+    def std(self):
+        return tuple([sqrt(v) for v in self.variance()])
+
+    def summary(self):
+        """
+        :rtype: dict
+        """
+        return {'samples': self.samples, 'converged': self.converged,
+                'stationary': self.stationary,
+                'offsets': dict(zip(AXES, self.offsets())),
+                'std': dict(zip(AXES, self.std()))}
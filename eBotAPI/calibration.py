@@ -0,0 +1,152 @@
+"""
+On-disk cache of the IMU offsets and calibration values of each robot.
+
+Estimating the offsets takes a few seconds of frames at rest (see bias)
+and calibration_values needs a round trip to the robot. Both are stored
+in a JSON file keyed by device identity, so that reconnecting to a robot
+calibrated recently starts with converged offsets.
+
+Cached offsets are discarded when they are older than max_age seconds or
+when the robot temperature (temperature_sensor) differs by more than
+max_temperature_delta degrees from the one they were estimated at, since
+the IMU offsets drift with temperature.
+"""
+import json
+import os
+from threading import Lock
+from time import time
+
+DEFAULT_PATH = os.path.join(os.path.expanduser('~'), '.ebot',
+                            'calibration.json')
+
+
+def device_key(port_name):
+    """
+    Identity of the device behind a serial port: its USB/Bluetooth
+    hardware id when pyserial can tell it, the resolved port path
+    otherwise.
+
+    :rtype: str
+    """
+    path = os.path.realpath(port_name) if os.path.exists(port_name) \
+        else port_name
+    try:
+        from serial.tools import list_ports
+        for info in list_ports.comports():
+            if info.device in (port_name, path) and info.hwid and \
+                    info.hwid != 'n/a':
+                return info.hwid
+    except Exception:
+        pass
+    return path
+
+
+class CalibrationCache:
+    def __init__(self, path=None, max_age=24 * 3600.,
+                 max_temperature_delta=5.):
+        """
+        :param path: JSON file, DEFAULT_PATH (~/.ebot/calibration.json) if
+            None
+        :param max_age: cached entries older than this (s) are ignored
+        :param max_temperature_delta: cached offsets are ignored if the
+            temperature differs more than this (deg C)
+        """
+        self.path = DEFAULT_PATH if path is None else path
+        self.max_age = max_age
+        self.max_temperature_delta = max_temperature_delta
+        self.lock = Lock()
+        return
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                entries = json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
+        return entries if isinstance(entries, dict) else {}
+
+    def _write(self, entries):
+        folder = os.path.dirname(self.path)
+        if folder and not os.path.isdir(folder):
+            os.makedirs(folder)
+        tmp = '{}.{}.tmp'.format(self.path, os.getpid())
+        with open(tmp, 'w') as f:
+            json.dump(entries, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.path)
+        return
+
+    def _update(self, key, **fields):
+        with self.lock:
+            entries = self._read()
+            entry = entries.setdefault(key, {})
+            entry.update(fields)
+            self._write(entries)
+        return
+
+    def get(self, key):
+        """
+        :rtype: dict
+        :return: the raw entry of a device, without any validation, or None
+        """
+        return self._read().get(key)
+
+    def load_offsets(self, key, temperature=None):
+        """
+        :param temperature: current temperature of the robot; the check is
+            skipped if None
+        :rtype: dict
+        :return: dict with offsets, std, samples, temperature and time, or
+            None if there is no valid entry
+        """
+        entry = self.get(key)
+        if not entry or 'offsets' not in entry:
+            return None
+        if time() - entry['time'] > self.max_age:
+            return None
+        if temperature is not None and entry['temperature'] is not None \
+                and abs(temperature - entry['temperature']) > \
+                self.max_temperature_delta:
+            return None
+        return entry
+
+    def store_offsets(self, key, offsets, std, samples, temperature):
+        """
+        :param offsets: Ax, Ay, Az, Gx, Gy, Gz offsets
+        :param std: standard deviation of each axis at rest
+        :param samples: number of frames the offsets were estimated from
+        :param temperature: robot temperature during the estimation
+        """
+        self._update(key, offsets=list(offsets), std=list(std),
+                     samples=samples, temperature=temperature, time=time())
+        return
+
+    def load_calibration_values(self, key):
+        """
+        :rtype: list
+        :return: cached result of eBot.calibration_values, or None if there
+            is none or it is older than max_age
+        """
+        entry = self.get(key)
+        if not entry or 'calibration_values' not in entry:
+            return None
+        if time() - entry['calibration_time'] > self.max_age:
+            return None
+        return entry['calibration_values']
+
+    def store_calibration_values(self, key, values):
+        self._update(key, calibration_values=list(values),
+                     calibration_time=time())
+        return
+
+    def invalidate(self, key=None):
+        """
+        Removes the entry of a device, or every entry if key is None.
+        """
+        with self.lock:
+            entries = self._read()
+            if key is None:
+                entries = {}
+            else:
+                entries.pop(key, None)
+            self._write(entries)
+        return
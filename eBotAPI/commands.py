@@ -0,0 +1,262 @@
+"""
+Background writer for eBot commands.
+
+The firmware needs some spacing between consecutive commands. Instead of
+sleeping in the caller after every write, commands are queued and a
+writer thread sends them in order, waiting the required spacing between
+writes. Commands sent with a key are coalesced: while one is still
+queued, a newer command with the same key replaces it, so e.g. only the
+latest wheel speeds are ever sent. The replacement never overtakes the
+commands queued in between: if there are any, the stale command is
+dropped and the new one goes to the end of the queue.
+
+PolledCommandWriter follows the same rules without a thread of its own,
+for callers that run an I/O loop anyway (see fleet.Fleet).
+"""
+from collections import deque
+from threading import Condition, Lock, Thread
+from time import perf_counter, sleep
+
+
+class CommandQueue:
+    """
+    Queueing, coalescing and statistics shared by CommandWriter and
+    aio.AsyncCommandWriter, which add the locking and the writing.
+    """
+    def __init__(self, port, spacing=0.05):
+        """
+        :param port: SafeSerial the commands are written to
+        :param spacing: minimum time between two writes, in seconds
+        """
+        self.port = port
+        self.spacing = spacing
+        self.queue = deque()  # entries are [key, message, seq, enqueue time]
+        self.pending = {}     # key -> queued entry
+        self.queued = 0       # sequence number of the last queued command
+        self.error = None
+        self.reset_stats()
+        return
+
+    def enqueue(self, message, key=None):
+        """
+        :param key: commands with the same key are coalesced while queued
+        :rtype: bool
+        :return: True if the queue got a new entry, False if the message
+            replaced the one of its tail
+        """
+        entry = self.pending.get(key) if key is not None else None
+        if entry is not None:
+            self.coalesced += 1
+            if entry is self.queue[-1]:
+                entry[1] = message
+                return False
+            self._remove(entry)
+        self.queued += 1
+        entry = [key, message, self.queued, perf_counter()]
+        self.queue.append(entry)
+        if key is not None:
+            self.pending[key] = entry
+        return True
+
+    def _remove(self, entry):
+        # By identity: entries with equal contents may be queued
+        queue = self.queue
+        for i, other in enumerate(queue):
+            if other is entry:
+                del queue[i]
+                return
+        return
+
+    def dequeue(self):
+        """
+        :return: the oldest entry, [key, message, seq, enqueue time]
+        """
+        entry = self.queue.popleft()
+        if entry[0] is not None:
+            del self.pending[entry[0]]
+        return entry
+
+    def clear(self):
+        self.queue.clear()
+        self.pending.clear()
+        return
+
+    def record_write(self, enqueued):
+        """
+        Accounts for a command written now that was queued at enqueued.
+
+        :return: the time it was written
+        """
+        now = perf_counter()
+        latency = now - enqueued
+        self.sent += 1
+        self.latency_total += latency
+        self.latency_last = latency
+        if latency > self.latency_max:
+            self.latency_max = latency
+        return now
+
+    def reset_stats(self):
+        self.sent = 0
+        self.coalesced = 0
+        self.latency_total = 0.
+        self.latency_last = 0.
+        self.latency_max = 0.
+        return
+
+    def stats(self):
+        """
+        :rtype: dict
+        :return: current queue depth, commands sent and coalesced, and the
+            last, mean and max time from queueing to write, in seconds.
+        """
+        return {'depth': len(self.queue),
+                'sent': self.sent,
+                'coalesced': self.coalesced,
+                'latency_last': self.latency_last,
+                'latency_mean': self.latency_total / self.sent
+                if self.sent else 0.,
+                'latency_max': self.latency_max}
+
+
+class CommandWriter(CommandQueue):
+    def __init__(self, port, spacing=0.05):
+        """
+        :param port: SafeSerial the commands are written to
+        :param spacing: minimum time between two writes, in seconds
+        """
+        CommandQueue.__init__(self, port, spacing)
+        self.cond = Condition()
+        self.running = False
+        self.thread = None
+        return
+
+    def start(self):
+        with self.cond:
+            self.running = True
+        self.thread = Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+        return
+
+    def stop(self, flush=True, timeout=2.0):
+        """
+        Stops the writer thread.
+
+        :param flush: send the commands still queued before stopping
+        :param timeout: maximum time to wait for the thread
+        """
+        with self.cond:
+            self.running = False
+            if not flush:
+                self.clear()
+            self.cond.notify()
+        if self.thread is not None:
+            self.thread.join(timeout)
+        return
+
+    def send(self, message, key=None):
+        """
+        Queues a command and returns immediately.
+
+        :param message: command to write
+        :param key: commands with the same key are coalesced while queued
+        """
+        with self.cond:
+            if self.enqueue(message, key):
+                self.cond.notify()
+        return
+
+    def run(self):
+        last_write = -self.spacing
+        while True:
+            with self.cond:
+                while self.running and not self.queue:
+                    self.cond.wait()
+                if not self.queue:
+                    break
+                # Wait out the spacing with the command still queued, so
+                # newer commands can keep replacing it.
+                delay = last_write + self.spacing - perf_counter()
+                if delay > 0:
+                    self.cond.wait(delay)
+                    continue
+                key, message, seq, enqueued = self.dequeue()
+            try:
+                self.port.write(message)
+            except Exception as ex:
+                with self.cond:
+                    self.error = ex
+                    self.running = False
+                    self.clear()
+                break
+            last_write = self.record_write(enqueued)
+        return
+
+
+class PolledCommandWriter(CommandQueue):
+    """
+    CommandWriter without a thread: the queued commands are written by
+    whoever calls poll, e.g. the I/O loop of a Fleet.
+    """
+    def __init__(self, port, spacing=0.05, wakeup=None):
+        """
+        :param wakeup: called without arguments when a command is queued,
+            to wake the poller up
+        """
+        CommandQueue.__init__(self, port, spacing)
+        self.wakeup = wakeup
+        self.lock = Lock()
+        self.last_write = -spacing
+        return
+
+    def send(self, message, key=None):
+        """
+        Queues a command and returns immediately.
+        """
+        with self.lock:
+            queued = self.enqueue(message, key)
+        if queued and self.wakeup is not None:
+            self.wakeup()
+        return
+
+    def poll(self):
+        """
+        Writes the oldest command if the spacing since the last write
+        allows it.
+
+        :return: seconds until the next command can be written, or None if
+            none is queued
+        """
+        with self.lock:
+            if not self.queue:
+                return None
+            delay = self.last_write + self.spacing - perf_counter()
+            if delay > 0:
+                return delay
+            key, message, seq, enqueued = self.dequeue()
+            try:
+                self.port.write(message)
+            except Exception as ex:
+                self.error = ex
+                self.clear()
+                return None
+            self.last_write = self.record_write(enqueued)
+            return self.spacing if self.queue else None
+
+    def stop(self, flush=True, timeout=2.0):
+        """
+        Writes the commands still queued from the caller, or drops them.
+
+        :param timeout: maximum time spent flushing
+        """
+        if not flush:
+            with self.lock:
+                self.clear()
+            return
+        deadline = perf_counter() + timeout
+        delay = self.poll()
+        while delay is not None and perf_counter() < deadline:
+            sleep(delay)
+            delay = self.poll()
+        return
@@ -1,11 +1,28 @@
-from time import sleep
+from time import sleep, time, thread_time, perf_counter
+from queue import Empty, Queue
 import os
 import sys
+import select
 from math import degrees, pi
 import glob
+import numpy as np
 import serial
-from threading import Lock, Thread
+from threading import Event, Lock, Thread
+from operator import attrgetter
 from .Locator_EKF import Locator_EKF
+from .telemetry import FrameReader, FrameClock, FIELDS, N_FIELDS, Snapshot, \
+    last_frame, split_frames, parse_frame
+from .history import TelemetryHistory
+from .commands import CommandWriter
+from .recording import TelemetryRecorder
+from .instrumentation import PipelineStats, loop_counters, loop_summary
+from .bias import AXES, BiasEstimator
+from .calibration import CalibrationCache, device_key
+from .events import EventDispatcher
+from .mapping import sonar_points
+from .sharing import SharedTelemetry
+from .motion import MotionTask, DriveTo, TurnTo, FollowPath, \
+    quantize_speed
 
 if os.name == 'nt':
     try:
@@ -14,6 +31,123 @@ if os.name == 'nt':
         pass
 
 
+# Connection handshake, run once the robot has answered the probe. Each
+# step writes a command and moves on as soon as the expected reply is
+# read: 'ack' is a '>>1B' or '>>' line, 'line' any line and 'frame' the
+# first telemetry frame; other lines are skipped. If the reply does not
+# arrive the step ends after its timeout (s); a required step then fails
+# the connection.
+HANDSHAKE = (('<<1E', 'ack', 5.4, True),
+             ('<<1O', 'line', 0.4, False),
+             ('F', 'frame', 1.0, False))
+
+# Values in the reply to "2C" (calibration_values)
+CALIBRATION_FIELDS = 10
+
+
+def handshake_reply(kind, line):
+    """
+    :return: True if line is the reply expected by a handshake step, or
+        None if the step should keep waiting for it. Other lines, such as
+        a late answer to a probe, are ignored.
+    """
+    if kind == 'ack':
+        return True if line.strip() in ('>>1B', '>>') else None
+    if kind == 'frame':
+        return True if line.count(';') == 19 else None
+    return True
+
+
+def handshake_steps(port, times):
+    """
+    Runs the HANDSHAKE steps on an open port, recording in times how long
+    each one took.
+
+    Like probe_steps this is a generator, so that eBot and aio.AsyncEBot
+    share it: whenever it needs more data it yields the time (s) left
+    before the current step times out, and the caller resumes it once the
+    port is readable or that time has passed (see run_steps).
+
+    :return: False if a required step failed, True otherwise
+    """
+    buf = b''
+    for command, kind, timeout, required in HANDSHAKE:
+        t = perf_counter()
+        deadline = t + timeout
+        port.write(command)
+        ok = None
+        while ok is None:
+            nl = buf.find(b'\n')
+            if nl < 0:
+                wait = deadline - perf_counter()
+                if wait <= 0:
+                    break
+                yield wait
+                buf += port.read_available()
+                continue
+            line = buf[:nl].decode(errors='replace')
+            buf = buf[nl + 1:]
+            ok = handshake_reply(kind, line)
+        times[command] = perf_counter() - t
+        if required and not ok:
+            return False
+    port.flushInput()
+    port.flushOutput()
+    return True
+
+
+def probe_steps(port, strikes=40, deadline=None):
+    """
+    Asks the device on an open port whether it is an eBot, sending '<<1?'
+    up to strikes times. Generator, see handshake_steps.
+
+    :param deadline: perf_counter() after which the probe gives up
+    :return: True if an eBot answered
+    """
+    if deadline is None:
+        deadline = float('inf')
+    port.flushInput()
+    port.flushOutput()
+    while strikes > 0 and perf_counter() < deadline:
+        strikes -= 1
+        port.write("<<1?")
+        reply = b''
+        answer_by = min(perf_counter() + 0.5, deadline)
+        while b'\n' not in reply:
+            wait = answer_by - perf_counter()
+            if wait <= 0:
+                break
+            yield wait
+            reply += port.read_available()
+        if reply[:2] == b"eB":
+            port.flushInput()
+            port.flushOutput()
+            return True
+    return False
+
+
+def run_steps(steps, port, stop=None):
+    """
+    Runs a handshake_steps or probe_steps generator, blocking on port
+    while it waits for data.
+
+    :param stop: Event that aborts the steps when set
+    :return: the result of the generator, None if aborted
+    """
+    try:
+        wait = next(steps)
+        while True:
+            if stop is not None:
+                if stop.is_set():
+                    steps.close()
+                    return None
+                wait = min(wait, 0.1)
+            port.wait_readable(wait)
+            wait = next(steps)
+    except StopIteration as done:
+        return done.value
+
+
 class SafeSerial(serial.Serial):
     def __init__(self, *args, **kws):
         lock = kws.pop("lock", None)
@@ -21,19 +155,78 @@ class SafeSerial(serial.Serial):
             self.lock = lock
         else:
             self.lock = Lock()
+        self.stats = None  # instrumentation.PipelineStats, when timing
         super(SafeSerial, self).__init__(*args, **kws)
         return
 
+    def _acquire(self):
+        # Takes the lock; when timing, records the wait and returns the
+        # time it was acquired.
+        stats = self.stats
+        if stats is None:
+            self.lock.acquire()
+            return None
+        t0 = perf_counter()
+        self.lock.acquire()
+        t1 = perf_counter()
+        stats.record('lock_wait', t1 - t0)
+        return t1
+
+    def _release(self, stage, t1):
+        self.lock.release()
+        if t1 is not None:
+            self.stats.record(stage, perf_counter() - t1)
+        return
+
     def readline(self):
-        with self.lock:
+        t1 = self._acquire()
+        try:
             m = super(SafeSerial, self).readline()
+        finally:
+            self._release('readline', t1)
         return m.decode()
 
+    def read_available(self):
+        """
+        Reads every byte currently buffered by the port with a single call.
+
+        :rtype: bytes
+        """
+        t1 = self._acquire()
+        try:
+            n = self.in_waiting
+            m = super(SafeSerial, self).read(n) if n else b''
+        finally:
+            self._release('serial_read', t1)
+        return m
+
+    def wait_readable(self, timeout):
+        """
+        Blocks until the port has data to read or the timeout expires. The
+        lock is not held while waiting, so writers are never stalled.
+
+        :param timeout: maximum wait in seconds
+        :rtype: bool
+        :return: True if data is available
+        """
+        if self.in_waiting:
+            return True
+        fd = getattr(self, 'fd', None)
+        if fd is not None:
+            r, _, _ = select.select([fd], [], [], timeout)
+            return bool(r)
+        # No pollable descriptor (Windows): fall back to a short sleep
+        sleep(min(timeout, 0.005))
+        return self.in_waiting > 0
+
     def write(self, mess, **kws):
         if not isinstance(mess, bytes):
             mess = mess.encode()
-        with self.lock:
+        t1 = self._acquire()
+        try:
             m = super(SafeSerial, self).write(mess, **kws)
+        finally:
+            self._release('serial_write', t1)
         return m
 
     def flushInput(self):
@@ -48,21 +241,59 @@ class SafeSerial(serial.Serial):
 
 
 class eBot:
-    def __init__(self, pos=(0., 0.), heading=0., lock=None):
-        self.sonarValues = [0, 0, 0, 0, 0, 0]
+    def __init__(self, pos=(0., 0.), heading=0., lock=None,
+                 history_size=4096, async_commands=True,
+                 calibration_cache=None, catch_up=False):
+        """
+        :param catch_up: process every frame received, in order, instead
+            of only the newest one (see update_all).
+        :param calibration_cache: CalibrationCache, or path of its file,
+            used to reuse the IMU offsets and calibration values of a
+            robot calibrated recently. Disabled if None.
+        """
         self.all_Values = [0, 0, 0, 0, 0, 0, 0, 0, 0, 0]
         self.port = None
         self.serialReady = False
-        self.ldrvalue = [0, 0]
-        self.p_value = [0, 0]
-        self.acc_values = [0, 0, 0, 0, 0, 0]
         self.pos_values = [0, 0, 0]
-        self.EKF = Locator_EKF(pos, heading, 0.1)
+        self.snapshot = None  # Snapshot of the latest frame
+        self.first_frame = Event()  # set once a frame has been processed
+        self.ready_timeout = 5.  # max wait of connect for the first frame
+        self.EKF = Locator_EKF(pos, heading, 0.1, engine='fast')
         self.updating = False
+        self.update_thread = None
         self.offset = False
         self.gyro_heading = degrees(heading)
         self.offset_counter_iteration = 100
+        self.bias = BiasEstimator(self.offset_counter_iteration)
         self.lock = lock
+        self.reader = FrameReader()
+        self.clock = FrameClock()
+        self.catch_up = catch_up
+        self.events = None  # EventDispatcher, created by subscribe
+        self.event_workers = 4  # threads for threaded subscriptions
+        self.motion = None  # MotionTask running, if any
+        self.shared = None  # SharedTelemetry publishing the frames
+        self.skipped = 0  # frames read_all discarded before the last one
+        self.frame_counts = {'processed': 0, 'skipped': 0, 'bad': 0}
+        self.history_buffer = TelemetryHistory(history_size)
+        self.update_timeout = 0.1  # max idle wait of the update thread
+        self.command_spacing = 0.05  # firmware delay between commands
+        self.async_commands = async_commands
+        self.writer = None
+        self.connect_times = {}  # duration of each connection step (s)
+        self.recorder = None
+        # Replies to "2C" taken out of the telemetry stream (see _receive)
+        self.replies = Queue()
+        self.pipeline_stats = None  # PipelineStats when timing is enabled
+        if calibration_cache is not None and \
+                not isinstance(calibration_cache, CalibrationCache):
+            calibration_cache = CalibrationCache(calibration_cache)
+        self.calibration_cache = calibration_cache
+        self.calibration_key = None
+        # 'load' until the first frame, 'store' until the offsets converge
+        self.calibration_pending = None
+        self.calibration_samples = 0  # bias samples last loaded or stored
+        self.reset_loop_stats()
         return
 
     def destroy(self):
@@ -70,7 +301,7 @@ class eBot:
         Destructor function for eBot class.
         """
         self.disconnect()
-        self.sonarValues = None
+        self.snapshot = None
         self.port = None
         self.serialReady = None
 
@@ -112,20 +343,19 @@ class eBot:
         """
         self.connect()
 
-    def connect(self, port_path=None):
+    def candidate_ports(self, port_path=None):
         """
-        Opens connection with the eBot via BLE. Connects with the first eBot
-        that the computer is paired to.
+        Ports that may have an eBot attached.
 
-        :raise Exception: No eBot found
+        :param port_path: if given, the only candidate
+        :rtype: list
         """
-        baudRate = 115200
         if port_path:
             ports = [port_path]
         else:
             ports = []
             if os.name == "posix":
-                if sys.platform == "linux2":
+                if sys.platform.startswith("linux"):
                     ports = glob.glob('/dev/rfcomm*')
                 elif sys.platform == "darwin":
                     ports = glob.glob('/dev/tty.eBo*')
@@ -134,83 +364,153 @@ class eBot:
                     sys.exit()
             elif os.name == "nt":
                 ports = self.getOpenPorts()
+        return ports
+
+    def connect(self, port_path=None, timeout=20., background=True):
+        """
+        Opens connection with the eBot via BLE. Connects with the first eBot
+        that the computer is paired to. All candidate ports are probed at
+        the same time; the first one that answers wins and the others are
+        closed.
+
+        :param port_path: only probe this port
+        :param timeout: overall deadline for finding the robot, in seconds
+        :param background: start the update thread once connected and
+                           wait, at most ready_timeout seconds, until the
+                           first frame has been processed. Without it,
+                           the caller has to run update_all whenever the
+                           port is readable (see Fleet).
+        :raise Exception: No eBot found
+        """
+        t0 = time()
+        ports = self.candidate_ports(port_path)
+        self.first_frame.clear()
+        self.clock.reset()  # time stamps of the previous session
 
-        connect = 0
-        line = "a"
         print("# Connecting", end="")
-        for port in ports:
-            print(".", end="")
-            try:
-                if (line[:2] == "eB"):
-                    break
-                s = SafeSerial(port, baudRate, timeout=5.0, writeTimeout=5.0,
-                               lock=self.lock)
-                s.flushInput()
-                s.flushOutput()
-                strikes = 40
-                while line[:2] != "eB" and strikes > 0:
-                    strikes -= 1
-                    s.write("<<1?")
-                    sleep(0.5)
-                    line = s.readline()
-                if line[:2] == "eB":
-                    connect = 1
-                    self.port = s
-                    self.portName = port
-                    self.port.flushInput()
-                    self.port.flushOutput()
-                else:
-                    s.close()
-            except Exception:
-                try:
-                    s.close()
-                except Exception:
-                    pass
+        found = []
+        done = Event()
+        stop = Event()
+        remaining = [len(ports)]
+        lock = Lock()
 
-        if (connect == 0):
-            try:
+        def probe(port_name):
+            s = self._probe_port(port_name, stop, perf_counter() + timeout)
+            with lock:
+                if s is not None and not found and not stop.is_set():
+                    found.append((port_name, s))
+                    s = None
+                remaining[0] -= 1
+                if found or not remaining[0]:
+                    done.set()
+            if s is not None:
                 s.close()
-            except Exception:
-                pass
+
+        threads = [Thread(target=probe, args=(port,)) for port in ports]
+        for thread in threads:
+            print(".", end="")
+            thread.daemon = True
+            thread.start()
+        if threads:
+            done.wait(timeout)
+        with lock:
+            stop.set()
+        for thread in threads:
+            thread.join(1.)
+
+        if not found:
             raise Exception("No eBot found")
+        self.portName, self.port = found[0]
+        self.port.stats = self.pipeline_stats
+        if self.lock is not None:
+            self.port.lock = self.lock
+        self.port.flushInput()
+        self.port.flushOutput()
+        self.connect_times = {'probe': time() - t0}
+        self.use_calibration_cache(self.portName)
 
         try:
-            self.port.write('<<1E')
-            sleep(0.4)
-            line = self.port.readline()
-            if line != ">>1B\n" and line != ">>1B" and line != ">>\n" and \
-               line != ">>":
-                self.lostConnection()
-            self.port.write("<<1O")
-            sleep(0.4)
-            self.port.write("F")
-            sleep(0.2)
-            self.port.flushInput()
-            self.port.flushOutput()
+            self._handshake()
+            self.connect_times['time_to_ready'] = time() - t0
             print("Done")
             self.serialReady = True
+            if self.async_commands:
+                self.writer = CommandWriter(self.port, self.command_spacing)
+                self.writer.start()
         except Exception:
             sys.stderr.write("Could not write to serial port.\n")
             self.serialReady = False
             sys.stderr.write("Robot turned off or no longer connected.\n")
-        self.start_update_background()
+        if background:
+            self.start_update_background()
+        return
+
+    def _handshake(self):
+        """
+        Runs the HANDSHAKE steps on the open port, recording how long each
+        one took in connect_times.
+        """
+        if not run_steps(handshake_steps(self.port, self.connect_times),
+                         self.port):
+            self.lostConnection()
+        self.reader.clear()
         return
 
+    def _probe_port(self, port_name, stop, deadline, strikes=40):
+        """
+        Asks the device on a port whether it is an eBot.
+
+        :param stop: Event that aborts the probe when set
+        :param deadline: perf_counter() after which the probe gives up
+        :return: the open SafeSerial if an eBot answered, None otherwise
+        """
+        try:
+            s = SafeSerial(port_name, 115200, timeout=5.0, writeTimeout=5.0)
+        except Exception:
+            return None
+        try:
+            if run_steps(probe_steps(s, strikes, deadline), s, stop):
+                return s
+        except Exception:
+            pass
+        s.close()
+        return None
+
     def start_update_background(self):
+        """
+        Starts the update thread and waits until it has processed the first
+        frame, so the getters have a snapshot to read.
+        """
         if not self.updating:
             self.update_thread = Thread(target=self.update_background)
             self.updating = True
             self.update_thread.start()
-            print("# Turning on localization procedure. Computing offset",
-                  end=" ")
-            while not self.offset:
-                sleep(0.5)
-                print(". ", end=" ")
-            print("Done")
+            print("# Turning on localization procedure")
+            if not self.wait_ready(self.ready_timeout):
+                sys.stderr.write("No telemetry received from the robot.\n")
         return
 
+    def wait_ready(self, timeout=None):
+        """
+        Blocks until the first frame has been processed.
+
+        :param timeout: maximum wait in seconds, None to wait forever
+        :rtype: bool
+        :return: True once there is a snapshot, False on timeout or if the
+            update thread stopped before
+        """
+        deadline = None if timeout is None else time() + timeout
+        while not self.first_frame.wait(0.05):
+            thread = self.update_thread
+            if (thread is not None and not thread.is_alive()) or \
+                    (deadline is not None and time() > deadline):
+                return False
+        return True
+
     def stop_update_background(self):
         self.updating = False
+        if self.update_thread is None:
+            return
         if self.update_thread.is_alive():
             self.update_thread.join(5)
         if self.update_thread.is_alive():
@@ -226,109 +526,612 @@ class eBot:
         #    except:
         #        self.lostConnection()
         # line = self.port.readline()
-        line = None
-        while self.port.inWaiting() > 90:  # one message is 105 chars long
-            line = self.port.readline()
+        stats = self.pipeline_stats
+        if stats is not None:
+            t0 = perf_counter()
+        block = self._receive()
+        # Only the newest complete frame is used, older ones are dropped
+        line = last_frame(block)
+        data = []
         if line:
+            if stats is not None:
+                t1 = perf_counter()
             try:
-                data = [float(x) for x in line.rstrip('\n').split(";")]
-            except Exception:
+                data = parse_frame(line)
+            except ValueError:
                 sys.stderr.write("Bad format message:")
-                sys.stderr.write(line)
-                data = []
-        else:
-            data = []
+                sys.stderr.write(repr(line))
+            n = block.count(b'\n')
+            self.skipped = n - 1
+            counts = self.frame_counts
+            counts['skipped'] += n - 1
+            if not data:
+                counts['bad'] += 1
+            if stats is not None:
+                stats.record('parse', perf_counter() - t1)
+                stats.count('frames_read', n)
+                stats.count('frames_skipped', n - 1)
+                if not data:
+                    stats.count('frames_bad')
+        if stats is not None:
+            stats.record('read_all', perf_counter() - t0)
+        return data
+
+    def _receive(self):
+        """
+        Reads the complete frames received and records them. Replies to
+        calibration_values, which arrive among the frames, are moved to
+        self.replies.
+
+        :rtype: bytes
+        :return: block of frames, see FrameReader.pop_block
+        """
+        block = self.reader.read(self.port)
+        if block and block.count(b';') != \
+                (N_FIELDS - 1) * block.count(b'\n'):
+            frames = []
+            for line in split_frames(block):
+                if line.count(b';') == CALIBRATION_FIELDS - 1:
+                    self.replies.put(line.decode(errors='replace'))
+                else:
+                    frames.append(line + b'\n')
+            block = b''.join(frames)
+        recorder = self.recorder  # stop_recording may run meanwhile
+        if block and recorder is not None:
+            recorder.write_block(block)
+        return block
+
+    def _request_reply(self, command, timeout=1.):
+        """
+        Writes a command and waits for its reply. When the update thread
+        runs, it reads the reply out of the telemetry stream; otherwise
+        the port is read here, dropping the frames received meanwhile.
+
+        :return: the reply split on ';', or None after the timeout
+        """
+        replies = self.replies
+        while not replies.empty():
+            replies.get_nowait()  # late reply to an earlier request
+        if self.serialReady:
+            try:
+                self.port.write(command)
+            except Exception:
+                self.lostConnection()
+        deadline = perf_counter() + timeout
+        while True:
+            remaining = deadline - perf_counter()
+            try:
+                if self.updating:
+                    return replies.get(timeout=max(remaining, 0.)).split(';')
+                return replies.get_nowait().split(';')
+            except Empty:
+                if remaining <= 0:
+                    return None
+            self.port.wait_readable(min(remaining, self.update_timeout))
+            self._receive()
+
+    def read_block(self):
+        """
+        Like read_all, but parses every complete frame received instead of
+        only the newest one. Malformed frames are left out.
+
+        :rtype: list
+        :return: the frames in order, each a list of 20 values
+        """
+        stats = self.pipeline_stats
+        if stats is not None:
+            t0 = perf_counter()
+        block = self._receive()
+        if stats is not None:
+            t1 = perf_counter()
+        # Blocks are a few frames long at most when keeping up, where
+        # parse_frame beats the vectorized parse_block
+        rows = []
+        bad = 0
+        for line in split_frames(block):
+            try:
+                rows.append(parse_frame(line))
+            except ValueError:
+                bad += 1
+        if bad:
+            self.frame_counts['bad'] += bad
+            sys.stderr.write("{} bad format messages\n".format(bad))
+        self.skipped = 0
+        if stats is not None:
+            t2 = perf_counter()
+            stats.record('parse', t2 - t1)
+            stats.count('frames_read', len(rows) + bad)
+            if bad:
+                stats.count('frames_bad', bad)
+            stats.record('read_all', t2 - t0)
+        return rows
+
+    def read_next(self):
+        """
+        Like read_all, but blocks until a frame is available instead of
+        returning an empty list.
+
+        :rtype: list
+        """
+        data = self.read_all()
+        while not data:
+            self.port.wait_readable(self.update_timeout)
+            data = self.read_all()
         return data
 
     def set_offset(self):
-        if not self.offset:
-            data = []
-            while not data:
-                data = self.read_all()
-            self.Ax_offset = data[1]
-            self.Ay_offset = data[2]
-            self.Az_offset = data[3]
-            self.Gx_offset = data[4]
-            self.Gy_offset = data[5]
-            self.Gz_offset = data[6]
-            for i in range(self.offset_counter_iteration):
-                data = []
-                while not data:
-                    data = self.read_all()
-                self.Ax_offset += data[1]
-                self.Ay_offset += data[2]
-                self.Az_offset += data[3]
-                self.Gx_offset += data[4]
-                self.Gy_offset += data[5]
-                self.Gz_offset += data[6]
-            self.Ax_offset /= self.offset_counter_iteration
-            self.Ay_offset /= self.offset_counter_iteration
-            self.Az_offset /= self.offset_counter_iteration
-            self.Gx_offset /= self.offset_counter_iteration
-            self.Gy_offset /= self.offset_counter_iteration
-            self.Gz_offset /= self.offset_counter_iteration
-            self.time_stamp = data[0]
-            self.offset = True
+        """
+        Blocks until offset_counter_iteration frames have been taken at
+        rest. Not needed to start localization, which runs on the
+        provisional offsets from the first frame (see bias); only useful
+        to wait for a converged estimate when the update thread is not
+        running.
+        """
+        self.bias.min_samples = self.offset_counter_iteration
+        while not self.bias.converged:
+            self.process_frame(self.read_next())
+        return
+
+    def apply_offset(self, frames):
+        """
+        Computes the accelerometer and gyroscope offsets from frames
+        recorded with the robot at rest and publishes the last one as the
+        first snapshot.
+
+        :param frames: frames taken at rest
+        """
+        self.bias.reset()
+        for data in frames:
+            self.bias.add(data[1:7])
+        self.offset = True
+        self.snapshot = Snapshot.from_frame(data, self.pos_values,
+                                            self.offsets())
+        if not self.first_frame.is_set():
+            self.first_frame.set()
+        return
+
+    def offsets(self):
+        """
+        Current estimate of the IMU offsets, refined while the robot is
+        stationary (see bias.BiasEstimator).
+
+        :rtype: tuple
+        :return: Ax, Ay, Az, Gx, Gy, Gz offsets
+        """
+        return self.bias.offsets()
+
+    def use_calibration_cache(self, port_name):
+        """
+        Identifies the robot behind port_name in the calibration cache.
+        Cached offsets, if still valid, are loaded with the first frame.
+        """
+        if self.calibration_cache is not None:
+            self.calibration_samples = 0
+            self.calibration_key = device_key(port_name)
+            self.calibration_pending = 'load'
+        return
+
+    def sync_calibration_cache(self, data):
+        """
+        Called with every frame while calibration_pending: loads valid
+        cached offsets for the temperature of the first frame, or stores
+        the estimate once it has converged.
+
+        :param data: the 20 values of a frame
+        """
+        bias = self.bias
+        if self.calibration_pending == 'load':
+            self.calibration_pending = 'store'
+            entry = self.calibration_cache.load_offsets(self.calibration_key,
+                                                        data[17])
+            if entry is not None:
+                bias.seed(entry['offsets'], entry['std'])
+                self.calibration_samples = bias.samples
+                self.calibration_pending = None
+        elif bias.converged:
+            self.store_calibration()
+            self.calibration_pending = None
         return
 
+    def store_calibration(self):
+        """
+        Writes the current offsets to the calibration cache, if they have
+        converged and changed since they were last loaded or stored.
+        """
+        bias = self.bias
+        snapshot = self.snapshot
+        if self.calibration_key is None or not bias.converged or \
+                bias.samples == self.calibration_samples or snapshot is None:
+            return
+        self.calibration_cache.store_offsets(
+            self.calibration_key, bias.offsets(), bias.std(), bias.samples,
+            snapshot.temperature_sensor)
+        self.calibration_samples = bias.samples
+        return
+
+    def bias_stats(self):
+        """
+        :rtype: dict
+        :return: samples used, whether the estimate has converged, whether
+            the robot is currently stationary and the mean and standard
+            deviation of each axis at rest.
+        """
+        return self.bias.summary()
+
     def unset_offset(self):
-        if self.offset:
-            self.Ax_offset = None
-            self.Ay_offset = None
-            self.Az_offset = None
-            self.Gx_offset = None
-            self.Gy_offset = None
-            self.Gz_offset = None
-            self.offset = False
+        """
+        Forgets the offsets, which are estimated again from the next
+        frames taken at rest.
+        """
+        self.bias.reset()
+        self.offset = False
         return
 
     def update_all(self):
-        data = self.read_all()
-        if data:
-            self.prev_time_stamp = self.time_stamp
-            self.time_stamp, self.Ax, self.Ay, self.Az, self.Gx, self.Gy, \
-                self.Gz, self.Ultrasonic_rear_right, self.Ultrasonic_right, \
-                self.Ultrasonic_front, self.Ultrasonic_left, \
-                self.Ultrasonic_rear_left, self.Ultrasonic_back, \
-                self.encoder_right, self.encoder_left, self.LDR_top, \
-                self.LDR_front, self.temperature_sensor, self.voltage, \
-                self.current = data
+        """
+        Reads what the robot sent and processes it. By default only the
+        newest frame is processed, the EKF covering the time elapsed since
+        the previous one in a single step. With catch_up every frame is
+        processed, in order (see process_block).
+
+        :rtype: list
+        :return: the last frame processed, or an empty list
+        """
+        stats = self.pipeline_stats
+        if stats is not None:
+            t0 = perf_counter()
+        if self.catch_up:
+            rows = self.read_block()
+            data = self.process_block(rows) if rows else []
         else:
-            return data
-        sampling_time = (self.time_stamp - self.prev_time_stamp) / 1000.
+            data = self.read_all()
+            if data:
+                self.process_frame(data)
+        if data and stats is not None:
+            stats.record('update_all', perf_counter() - t0)
+        return data
+
+    def integrate_frame(self, data):
+        """
+        First half of process_frame: refines the offsets, follows the
+        time stamps and integrates the gyro heading.
+
+        :param data: the 20 values of a frame
+        :return: (sampling time in s, heading in radians); the EKF is only
+            updated if the sampling time is > 0
+        """
+        # Offsets are refined while the robot stands still
+        bias = self.bias
+        if self.calibration_pending:
+            self.sync_calibration_cache(data)
+        bias.update(data)
+        self.offset = bias.ready
+        sampling_time = self.clock.step(data[0], self.skipped) / 1000.
+        self.skipped = 0
+        if sampling_time <= 0:
+            return 0., 0.
+        stats = self.pipeline_stats
+        if stats is not None:
+            t0 = perf_counter()
+        Gz = data[6]
+        Gz_offset = bias.mean[5]
+        if abs(Gz - Gz_offset) > 50:  # to remove the noise
+            # the integration to get the heading
+            delta = (Gz - Gz_offset) / 130.5
+            self.gyro_heading += sampling_time * delta
+        heading_scaled = self.gyro_heading % 360.
+        if heading_scaled > 180:
+            heading_scaled -= 360
+        elif heading_scaled < -180:
+            heading_scaled += 360
+        if stats is not None:
+            stats.record('gyro', perf_counter() - t0)
+        return sampling_time, heading_scaled * pi / 180.
+
+    def process_frame(self, data):
+        """
+        Integrates the gyro heading, runs the EKF and publishes the snapshot
+        for one parsed frame.
+
+        :param data: the 20 values of a frame
+        """
+        sampling_time, heading = self.integrate_frame(data)
         if sampling_time > 0:
-            if abs(self.Gz - self.Gz_offset) > 50:  # to remove the noise
-                # the integration to get the heading
-                delta = (self.Gz - self.Gz_offset) / 130.5
-                self.gyro_heading += sampling_time * delta
-            heading_scaled = self.gyro_heading % 360.
-            if heading_scaled > 180:
-                heading_scaled -= 360
-            elif heading_scaled < -180:
-                heading_scaled += 360
             self.pos_values[0], self.pos_values[1], self.pos_values[2] = \
-                self.EKF.update_state([heading_scaled * pi / 180.,
-                                       self.encoder_right / 1000.,
-                                       self.encoder_left / 1000.],
+                self.EKF.update_state([heading,
+                                       data[13] / 1000.,
+                                       data[14] / 1000.],
                                       sampling_time)
             self.pos_values[2] = degrees(self.pos_values[2])
+        # Readers see either the previous or this frame, never a mix
+        self.snapshot = Snapshot.from_frame(data, self.pos_values,
+                                            self.offsets())
+        if not self.first_frame.is_set():
+            self.first_frame.set()
+        self.history_buffer.append(data, self.pos_values)
+        shared = self.shared  # stop_sharing may run meanwhile
+        if shared is not None:
+            shared.publish(data, self.pos_values, self.offsets())
+        self.frame_counts['processed'] += 1
+        if self.events is not None:
+            self.events.dispatch(self.snapshot)
+        return
+
+    def process_block(self, rows):
+        """
+        Processes every frame of a block in order, with the same result as
+        calling process_frame on each of them, but runs the EKF over the
+        whole block with filter_batch and writes the history and the
+        snapshot once.
+
+        :param rows: list of N > 0 frames, or (N,20) array
+        :rtype: list
+        :return: the last frame
+        """
+        if len(rows) == 1:
+            data = list(rows[0])
+            self.process_frame(data)
+            return data
+        stats = self.pipeline_stats
+        if stats is not None:
+            t0 = perf_counter()
+        if isinstance(rows, np.ndarray):
+            rows = rows.tolist()
+        steps = []  # EKF input of the frames with a sampling time > 0
+        moved = np.zeros(len(rows), dtype=bool)
+        for i, data in enumerate(rows):
+            sampling_time, heading = self.integrate_frame(data)
+            if sampling_time > 0:
+                steps.append((heading, data[13] / 1000., data[14] / 1000.,
+                              sampling_time))
+                moved[i] = True
+        # Pose after every frame: the previous one until the EKF moves
+        poses = np.empty((len(steps) + 1, 3))
+        poses[0] = self.pos_values
+        if steps:
+            poses[1:] = self.EKF.filter_batch(steps)
+            poses[1:, 2] = np.degrees(poses[1:, 2])
+        poses = poses[np.cumsum(moved)]
+        self.pos_values = poses[-1].tolist()
+        data = rows[-1]
+        self.snapshot = Snapshot.from_frame(data, self.pos_values,
+                                            self.offsets())
+        if not self.first_frame.is_set():
+            self.first_frame.set()
+        self.history_buffer.extend(rows, poses)
+        shared = self.shared
+        if shared is not None:
+            shared.publish_block(rows, poses, self.offsets())
+        self.frame_counts['processed'] += len(rows)
+        if self.events is not None:
+            self.events.dispatch(self.snapshot)
+        if stats is not None:
+            stats.record('process_block', perf_counter() - t0)
         return data
 
+    def frame_stats(self):
+        """
+        Frame accounting since creation or the last reset_frame_stats.
+
+        :rtype: dict
+        :return: processed frames, skipped (received but not processed,
+            only outside catch_up mode), bad (malformed), dropped (lost
+            before reaching the computer, estimated from time_stamp gaps),
+            gaps, wraps of the time_stamp counter, resets (time_stamp going
+            backwards) and period_ms, the usual interval between frames.
+        """
+        stats = dict(self.frame_counts)
+        stats.update(self.clock.stats())
+        return stats
+
+    def reset_frame_stats(self):
+        for name in self.frame_counts:
+            self.frame_counts[name] = 0
+        self.clock.reset_counts()
+        return
+
+    def enable_stats(self, enable=True):
+        """
+        Turns per-stage timing of the update pipeline on or off. Timing
+        covers the serial port, read_all, update_all and the EKF; see
+        instrumentation for the list of stages.
+        """
+        stats = PipelineStats() if enable else None
+        if enable and self.pipeline_stats is not None:
+            stats = self.pipeline_stats
+        self.pipeline_stats = stats
+        self.EKF.stats = stats
+        if self.port is not None:
+            self.port.stats = stats
+        return
+
+    def stats(self):
+        """
+        Per-stage timing histograms and frame counters of the update
+        pipeline, or None if timing is disabled (see enable_stats).
+
+        :rtype: dict
+        """
+        if self.pipeline_stats is None:
+            return None
+        return self.pipeline_stats.summary()
+
+    def reset_stats(self):
+        """
+        Clears the timing histograms and counters.
+        """
+        if self.pipeline_stats is not None:
+            self.pipeline_stats.reset()
+        return
+
+    def share(self, name=None, capacity=4096):
+        """
+        Publishes every processed frame, with its pose, in a shared memory
+        segment that other local processes can read with
+        sharing.SharedTelemetry.attach(name).
+
+        :param name: segment name, chosen by the system if None
+        :param capacity: frames kept in the segment
+        :return: the segment name
+        :raise RuntimeError: the CPU is not x86 (see sharing)
+        """
+        self.stop_sharing()
+        self.shared = SharedTelemetry.create(name, capacity)
+        return self.shared.name
+
+    def stop_sharing(self):
+        """
+        Stops publishing and destroys the segment. Safe to call while the
+        update thread is running.
+        """
+        shared = self.shared
+        self.shared = None
+        if shared is not None:
+            shared.close()
+        return
+
+    def start_recording(self, path):
+        """
+        Appends every raw frame received from now on to a telemetry log,
+        with its host receive time. See recording.replay.
+
+        :param path: log file
+        """
+        self.stop_recording()
+        self.recorder = TelemetryRecorder(path)
+        return
+
+    def stop_recording(self):
+        """
+        Stops recording and closes the log. Safe to call while the update
+        thread is running.
+        """
+        recorder = self.recorder
+        self.recorder = None
+        if recorder is not None:
+            recorder.close()
+        return
+
+    def sonar_points(self, last_n=None, since=None, **kws):
+        """
+        World coordinates of the ultrasonic readings stored in the history
+        (see history for last_n and since, and mapping.sonar_points for
+        the other arguments).
+
+        :return: ((N*6,2) points, (N*6,) bool mask of valid readings)
+        """
+        return sonar_points(self.history(last_n, since), **kws)
+
+    def subscribe(self, callback, when=None, edge=None, threaded=False):
+        """
+        Registers callback to be called with the new Snapshot every time a
+        frame is processed, or only when the condition when fires. With
+        catch_up it is called once per block of frames. Subscriptions end
+        with disconnect.
+
+        Examples:
+            bot.subscribe(stop, 'Ultrasonic_front <= 250')
+            bot.subscribe(warn, 'voltage < 6.8', threaded=True)
+            bot.subscribe(log, events.Moved(0.1))
+
+        :param callback: called with the Snapshot
+        :param when: callable taking a Snapshot, or 'field op value'
+                     string; see events
+        :param edge: call only when the condition becomes true (default)
+        :param threaded: run the callback on a pool of event_workers
+                         threads instead of the update thread
+        :rtype: events.Subscription
+        :return: handle with cancel() and stats()
+        """
+        if self.events is None:
+            self.events = EventDispatcher(self.event_workers)
+        return self.events.subscribe(callback, when, edge, threaded)
+
+    def unsubscribe(self, subscription):
+        if self.events is not None:
+            self.events.unsubscribe(subscription)
+        return
+
+    def history(self, last_n=None, since=None):
+        """
+        Retrieves the recorded telemetry frames together with the position
+        estimated after each of them. Windowed statistics are available
+        through history_buffer.mean / min / max.
+
+        :param last_n: only the newest last_n frames
+        :param since: only frames with time_stamp >= since (ms)
+        :rtype: numpy.ndarray
+        :return: structured array with one field per telemetry value plus
+                 x, y and heading
+        """
+        return self.history_buffer.history(last_n, since)
+
     def update_background(self):
-        self.set_offset()
+        self.reset_loop_stats()
+        stats = self.loop_stats_values
+        cpu0 = thread_time()
         while self.updating:
-            # If update_all produces an error, the loop will end cleanly but
-            # the pos_values will be erased, so that any thread trying to
-            # access that will raise an Exception (or get nonsense).
             try:
-                self.update_all()
+                if self.update_all():
+                    stats['frames'] += 1
+                elif not self.port.wait_readable(self.update_timeout):
+                    stats['timeouts'] += 1
             except Exception as ex:
-                self.pos_values = None
-                self.updating = False
+                self._fail(ex)
                 raise ex
+            stats['iterations'] += 1
+            stats['cpu_time'] = thread_time() - cpu0
         self.halt()
         return
 
+    def _fail(self, ex):
+        """
+        Called by whatever loop feeds the robot (update_background, Fleet,
+        AsyncEBot) when update_all raises: the loop ends and pos_values are
+        erased, so that any thread trying to access them will raise an
+        Exception (or get nonsense).
+        """
+        self.pos_values = None
+        self.snapshot = None
+        self.updating = False
+        return
+
+    def reset_loop_stats(self):
+        """
+        Resets the counters returned by loop_stats.
+        """
+        self.loop_stats_values = loop_counters()
+        return
+
+    def loop_stats(self):
+        """
+        Activity of the update thread since it started (or since the last
+        reset_loop_stats).
+
+        :rtype: dict
+        :return: iterations of the loop, frames processed, idle waits that
+            timed out without data, CPU time used by the thread (s), wall
+            time elapsed (s) and cpu_usage as a fraction of one core.
+        """
+        return loop_summary(self.loop_stats_values)
+
+    def stop_pipeline(self):
+        """
+        Ends what runs on the processed frames: the motion in progress,
+        recording, sharing and subscriptions. The offsets refined during
+        the session are kept in the calibration cache. Called on
+        disconnect.
+        """
+        self.stop_motion()
+        self.stop_recording()
+        self.stop_sharing()
+        self.store_calibration()
+        events = self.events
+        self.events = None
+        if events is not None:
+            events.close()
+        return
+
     def close(self):
         """
         Close BLE connection with eBot.
@@ -341,6 +1144,10 @@ class eBot:
         Close BLE connection with eBot.
         """
         self.stop_update_background()
+        self.stop_pipeline()
+        if self.writer is not None:
+            self.writer.stop()
+            self.writer = None
         if self.serialReady:
             try:
                 self.port.close()
@@ -351,39 +1158,30 @@ class eBot:
         """
         Retrieves and returns all six ultrasonic sensor values in meters.
 
-        :rtype: list
-        :return: sonarValues
+        :rtype: tuple
+        :return: sonar values: rear left, left, front, right, rear right, back
         """
-        self.sonarValues[0] = float(self.Ultrasonic_rear_left) / 1000
-        self.sonarValues[1] = float(self.Ultrasonic_left) / 1000
-        self.sonarValues[2] = float(self.Ultrasonic_front) / 1000
-        self.sonarValues[3] = float(self.Ultrasonic_right) / 1000
-        self.sonarValues[4] = float(self.Ultrasonic_rear_right) / 1000
-        self.sonarValues[5] = float(self.Ultrasonic_back) / 1000
-        return self.sonarValues
+        return self.snapshot.sonar
 
-    def calibration_values(self):
+    def calibration_values(self, cached=True):
         """
         Retrieves and returns the calibration values of the eBot.
 
+        :param cached: use the calibration cache, if any: a recent cached
+                       result is returned without asking the robot, and a
+                       fresh one is stored.
         :rtype: list
         :return: all_Values (calibration values)
         """
-        if self.serialReady:
-            try:
-                self.port.write("2C")
-            except Exception:
-                self.lostConnection()
-        line = self.port.readline()
-        values = line.split(";")
-        while len(values) < 10:
-            if self.serialReady:
-                try:
-                    self.port.write("2C")
-                except Exception:
-                    self.lostConnection()
-            line = self.port.readline()
-            values = line.split(";")
+        cache = self.calibration_cache if cached else None
+        if cache is not None and self.calibration_key is not None:
+            values = cache.load_calibration_values(self.calibration_key)
+            if values is not None:
+                self.all_Values[:] = values
+                return self.all_Values
+        values = self._request_reply("2C")
+        while values is None:
+            values = self._request_reply("2C")
         self.all_Values[0] = float(values[0])
         self.all_Values[1] = float(values[1])
         self.all_Values[2] = float(values[2])
@@ -394,6 +1192,9 @@ class eBot:
         self.all_Values[5] = float(values[7]) / 1000
         self.all_Values[4] = float(values[8]) / 1000
         self.all_Values[9] = float(values[9]) / 1000
+        if cache is not None and self.calibration_key is not None:
+            cache.store_calibration_values(self.calibration_key,
+                                           self.all_Values)
         return self.all_Values
 
     def halt(self):
@@ -401,11 +1202,7 @@ class eBot:
         Halts the eBot, turns the motors and LEDs off.
         """
         if self.serialReady:
-            try:
-                self.port.write("2H")
-            except Exception:
-                self.lostConnection()
-        sleep(0.05)
+            self._send("2H")
 
     def led(self, bool):
         """
@@ -419,41 +1216,30 @@ class eBot:
             self.led_off()
         else:
             self.led_off()
-        sleep(0.05)
 
     def led_on(self):
         """
         Turns the LED on the eBot ON.
         """
         if self.serialReady:
-            try:
-                self.port.write("2L")
-            except Exception:
-                self.lostConnection()
-        sleep(0.05)
+            self._send("2L")
 
     def led_off(self):
         """
         Turns the LED on the eBot OFF.
         """
         if self.serialReady:
-            try:
-                self.port.write("2l")
-            except Exception:
-                self.lostConnection()
-        sleep(0.05)
+            self._send("2l")
 
     def light(self):
         """
         Retrieves and returns a list of tuples with the light index. 0 index is
         front and 1st index is top LDR readings.
 
-        :rtype: list
-        :return: ldrvalue: LDR Readings
+        :rtype: tuple
+        :return: LDR Readings
         """
-        self.ldrvalue[0] = float(self.LDR_front)
-        self.ldrvalue[1] = float(self.LDR_top)
-        return self.ldrvalue
+        return self.snapshot.light
 
     # Double check true vs. false
     def obstacle(self):
@@ -464,7 +1250,7 @@ class eBot:
         :rtype: bool
         :return: True if obstacle exists
         """
-        return self.Ultrasonic_front <= 250
+        return self.snapshot.Ultrasonic_front <= 250
 
     # TODO: implement x, y, z returns and a seperate odometry function
     def acceleration(self):
@@ -473,25 +1259,19 @@ class eBot:
         theta coordinates of robot with reference
         to starting position.
 
-        :rtype: list
-        :return: acc_values: Accelerometer values
+        :rtype: tuple
+        :return: Accelerometer values
         """
-        self.acc_values[0] = float(self.Ax - self.Ax_offset)
-        self.acc_values[1] = float(self.Ay - self.Ay_offset)
-        self.acc_values[2] = float(self.Az - self.Az_offset)
-        self.acc_values[3] = float(self.Gx - self.Gx_offset)
-        self.acc_values[4] = float(self.Gy - self.Gy_offset)
-        self.acc_values[5] = float(self.Gz - self.Gz_offset)
-        return self.acc_values
+        return self.snapshot.acc
 
     def position(self):
         """
         Retrieves and returns position values of the eBot.
 
-        :rtype: list
-        :return: pos_values: X,Y position values + heading
+        :rtype: tuple
+        :return: X,Y position values + heading
         """
-        return self.pos_values
+        return self.snapshot.pose
 
     # TODO: implement temperature feedback from MPU6050 IC
     def temperature(self):
@@ -502,26 +1282,21 @@ class eBot:
         :return: Temperature value.
         """
 
-        return int(self.temperature_sensor)
+        return int(self.snapshot.temperature_sensor)
 
     def power(self):
         """
 
         :return:
         """
-        self.p_value[0] = float(self.voltage)
-        self.p_value[1] = float(self.current)
-        return self.p_value
+        return self.snapshot.power
 
     def imperial_march(self):
         """
 
         """
         if self.serialReady:
-            try:
-                self.port.write("2b")
-            except Exception:
-                self.lostConnection()
+            self._send("2b", wait=False)
 
     def buzzer(self, btime, bfreq):
         """
@@ -538,10 +1313,7 @@ class eBot:
         str_len = str_len + 48
         myvalue = chr(str_len) + 'B' + bt1 + ';' + bf1
         if self.serialReady:
-            try:
-                self.port.write(myvalue)
-            except Exception:
-                self.lostConnection()
+            self._send(myvalue, wait=False)
         return
 
     def port_name(self):
@@ -577,21 +1349,59 @@ class eBot:
         :param LS: Speed of left motor
         :param RS: Speed of right motor
         """
-        if LS > 1:
-            LS = 1
-        elif LS < -1:
-            LS = -1
-        if RS > 1:
-            RS = 1
-        elif RS < -1:
-            RS = -1
-        left_speed = int((LS + 2) * 100)
-        right_speed = int((RS + 2) * 100)
-        try:
-            self.port.write("8w{:d};{:d}".format(left_speed, right_speed))
-        except Exception:
-            self.lostConnection()
-        sleep(0.05)
+        left_speed = quantize_speed(LS)
+        right_speed = quantize_speed(RS)
+        self._send("8w{:d};{:d}".format(left_speed, right_speed), key="wheels")
+        return
+
+    def drive_to(self, x, y, timeout=None, **kws):
+        """
+        Drives to the point (x, y), controlled from the update pipeline;
+        the call returns immediately. Any motion in progress is cancelled.
+
+        :param timeout: give up after this many seconds
+        :param kws: see motion.DriveTo
+        :rtype: motion.MotionTask
+        :return: handle to join(), await or cancel() the motion
+        """
+        return self.start_motion(DriveTo(x, y, **kws), timeout)
+
+    def turn_to(self, heading, timeout=None, **kws):
+        """
+        Turns in place to heading (deg). See drive_to and motion.TurnTo.
+
+        :rtype: motion.MotionTask
+        """
+        return self.start_motion(TurnTo(heading, **kws), timeout)
+
+    def follow_path(self, points, timeout=None, **kws):
+        """
+        Drives through a list of (x, y) points. See drive_to and
+        motion.FollowPath.
+
+        :rtype: motion.MotionTask
+        """
+        return self.start_motion(FollowPath(points, **kws), timeout)
+
+    def start_motion(self, controller, timeout=None):
+        """
+        Runs a motion controller (any object whose step(snapshot) returns
+        wheel speeds, or None when done) until it finishes.
+
+        :rtype: motion.MotionTask
+        """
+        self.stop_motion()
+        self.motion = MotionTask(self, controller, timeout)
+        return self.motion
+
+    def stop_motion(self):
+        """
+        Cancels the motion in progress, if any, and stops the wheels.
+        """
+        motion = self.motion
+        self.motion = None
+        if motion is not None:
+            motion.cancel()
         return
 
     def calibration(self, LS, RS):
@@ -610,14 +1420,46 @@ class eBot:
             RS = 1
         left_calibration = str(LS).zfill(4)
         right_calibration = str(RS).zfill(4)
+        self._send(":c{:s};{:s}".format(left_calibration, right_calibration))
+        return
+
+    def _send(self, message, key=None, wait=True):
+        """
+        Sends a command to the robot. With async_commands the command is
+        queued for the writer thread and the call returns immediately,
+        otherwise it is written here and, if wait, followed by the
+        firmware's inter-command delay.
+
+        :param key: queued commands with the same key are coalesced, only
+                    the newest one is sent
+        """
+        writer = self.writer
+        if writer is not None:
+            if writer.error is not None:
+                self.lostConnection()
+            writer.send(message, key)
+            return
         try:
-            self.port.write(":c{:s};{:s}".format(left_calibration,
-                                                 right_calibration))
+            self.port.write(message)
         except Exception:
             self.lostConnection()
-        sleep(0.05)
+        if wait:
+            sleep(self.command_spacing)
         return
 
+    def command_stats(self):
+        """
+        Statistics of the asynchronous command writer.
+
+        :rtype: dict
+        :return: queue depth, commands sent and coalesced, and write latency
+                 (see CommandWriter.stats), or None if commands are
+                 written synchronously.
+        """
+        if self.writer is None:
+            return None
+        return self.writer.stats()
+
     def lostConnection(self):
         """
         Handler for the case that the computer loses connection with the eBot.
@@ -630,3 +1472,16 @@ class eBot:
             pass
         self.serialReady = False
         raise Exception("Robot Connection Lost")
+
+
+# The raw telemetry values (eBot.Ax, eBot.Ultrasonic_front, ...) read
+# through to the current snapshot.
+for _name in FIELDS:
+    setattr(eBot, _name, property(attrgetter('snapshot.' + _name),
+                                  doc="{} of the latest frame".format(_name)))
+
+# Read-only IMU offsets (eBot.Ax_offset, ...), see offsets()
+for _i, _name in enumerate(AXES):
+    setattr(eBot, _name + '_offset',
+            property(lambda self, i=_i: self.bias.offsets()[i],
+                     doc="Current offset of {}".format(_name)))
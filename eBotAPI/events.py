@@ -0,0 +1,235 @@
+"""
+Subscriptions to the telemetry of an eBot.
+
+Callbacks are registered on the update pipeline and called with the new
+Snapshot every time a frame is processed, or only when a condition
+fires, so controllers do not have to poll the getters.
+
+Conditions are callables taking a Snapshot, or strings 'field op value'
+such as 'Ultrasonic_front <= 250' or 'voltage < 6.8', where field is any
+Snapshot field with a number (FIELDS, x, y, heading). By default a
+condition triggers the callback when it becomes true (edge), not on every
+frame while it stays true.
+
+Callbacks run in the update thread unless subscribed with threaded=True,
+in which case they run on a small thread pool. A threaded subscription
+never runs concurrently with itself: if it is still busy when it fires
+again, it is called once more afterwards with the latest Snapshot only.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from math import hypot
+from operator import attrgetter, lt, le, gt, ge, eq, ne
+import re
+import sys
+from threading import Lock
+
+from .telemetry import FIELDS, POSE_FIELDS
+
+OPERATORS = {'<': lt, '<=': le, '>': gt, '>=': ge, '==': eq, '!=': ne}
+_CONDITION = re.compile(r'^\s*(\w+)\s*(<=|>=|==|!=|<|>)\s*(\S+)\s*$')
+
+
+class Threshold:
+    def __init__(self, field, op, value):
+        """
+        Condition comparing one Snapshot field with a value.
+
+        :param field: name of the field, in FIELDS or POSE_FIELDS
+        :param op: one of OPERATORS
+        """
+        if field not in FIELDS + POSE_FIELDS:
+            raise ValueError("Unknown field {}".format(field))
+        if op not in OPERATORS:
+            raise ValueError("Unknown operator {}".format(op))
+        self.field = field
+        self.op = op
+        self.value = float(value)
+        self.get = attrgetter(field)
+        self.compare = OPERATORS[op]
+        return
+
+    def __call__(self, snapshot):
+        return self.compare(self.get(snapshot), self.value)
+
+    def __repr__(self):
+        return 'Threshold({!r}, {!r}, {!r})'.format(self.field, self.op,
+                                                    self.value)
+
+
+class Moved:
+    # Fires on every step, not only when it starts being true
+    edge = False
+
+    def __init__(self, distance):
+        """
+        Condition that fires when the robot has moved more than distance
+        (m) from where it last fired (or from the first pose seen).
+        """
+        self.distance = distance
+        self.origin = None
+        return
+
+    def __call__(self, snapshot):
+        if self.origin is None:
+            self.origin = (snapshot.x, snapshot.y)
+            return False
+        if hypot(snapshot.x - self.origin[0],
+                 snapshot.y - self.origin[1]) > self.distance:
+            self.origin = (snapshot.x, snapshot.y)
+            return True
+        return False
+
+
+def condition(spec):
+    """
+    :param spec: callable, or 'field op value' string
+    :return: callable taking a Snapshot
+    """
+    if spec is None or callable(spec):
+        return spec
+    match = _CONDITION.match(spec)
+    if match is None:
+        raise ValueError("Bad condition {!r}".format(spec))
+    field, op, value = match.groups()
+    return Threshold(field, op, value)
+
+
+class Subscription:
+    def __init__(self, dispatcher, callback, when=None, edge=None,
+                 threaded=False):
+        self.dispatcher = dispatcher
+        self.callback = callback
+        self.when = condition(when)
+        if edge is None:
+            edge = getattr(self.when, 'edge', True)
+        self.edge = edge and self.when is not None
+        self.threaded = threaded
+        self.active = False  # last value of the condition
+        self.calls = 0
+        self.coalesced = 0  # threaded calls replaced by a newer Snapshot
+        self.errors = 0
+        self.last_error = None
+        self.latest = None  # Snapshot waiting for the worker
+        self.scheduled = False
+        self.lock = Lock()
+        return
+
+    def cancel(self):
+        self.dispatcher.unsubscribe(self)
+        return
+
+    def fires(self, snapshot):
+        when = self.when
+        if when is None:
+            return True
+        active = bool(when(snapshot))
+        if not self.edge:
+            return active
+        fired = active and not self.active
+        self.active = active
+        return fired
+
+    def call(self, snapshot):
+        try:
+            self.callback(snapshot)
+        except Exception as ex:
+            self.errors += 1
+            self.last_error = ex
+            sys.stderr.write("Subscriber {!r} failed: {!r}\n".format(
+                self.callback, ex))
+        self.calls += 1
+        return
+
+    def schedule(self, pool, snapshot):
+        with self.lock:
+            if self.latest is not None:
+                self.coalesced += 1
+            self.latest = snapshot
+            if self.scheduled:
+                return
+            self.scheduled = True
+        pool.submit(self.drain)
+        return
+
+    def drain(self):
+        while True:
+            with self.lock:
+                snapshot = self.latest
+                self.latest = None
+                if snapshot is None:
+                    self.scheduled = False
+                    return
+            self.call(snapshot)
+
+    def stats(self):
+        return {'calls': self.calls, 'coalesced': self.coalesced,
+                'errors': self.errors}
+
+
+class EventDispatcher:
+    def __init__(self, workers=4):
+        """
+        :param workers: size of the thread pool used by threaded
+            subscriptions, created when the first one is added
+        """
+        self.workers = workers
+        self.subscriptions = ()  # replaced, never mutated, on (un)subscribe
+        self.pool = None
+        self.lock = Lock()
+        return
+
+    def __len__(self):
+        return len(self.subscriptions)
+
+    def subscribe(self, callback, when=None, edge=None, threaded=False):
+        """
+        :param callback: called with the Snapshot
+        :param when: condition (see module doc); every frame if None
+        :param edge: call only when the condition becomes true. Defaults to
+            True, except for conditions with edge = False such as Moved.
+        :param threaded: run the callback on the thread pool
+        :rtype: Subscription
+        """
+        subscription = Subscription(self, callback, when, edge, threaded)
+        with self.lock:
+            if threaded and self.pool is None:
+                self.pool = ThreadPoolExecutor(self.workers)
+            self.subscriptions = self.subscriptions + (subscription,)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscriptions = tuple([s for s in self.subscriptions
+                                        if s is not subscription])
+        return
+
+    def dispatch(self, snapshot):
+        """
+        Called by the update pipeline with every new Snapshot.
+        """
+        for subscription in self.subscriptions:
+            try:
+                fired = subscription.fires(snapshot)
+            except Exception as ex:
+                subscription.errors += 1
+                subscription.last_error = ex
+                continue
+            if not fired:
+                continue
+            if subscription.threaded:
+                subscription.schedule(self.pool, snapshot)
+            else:
+                subscription.call(snapshot)
+        return
+
+    def close(self, wait=True):
+        """
+        Drops every subscription and stops the thread pool.
+        """
+        with self.lock:
+            self.subscriptions = ()
+            pool = self.pool
+            self.pool = None
+        if pool is not None:
+            pool.shutdown(wait)
+        return
@@ -0,0 +1,273 @@
+"""
+Single threaded I/O loop for many robots.
+
+Each eBot normally runs its own update thread. A Fleet instead registers
+the serial descriptors of all its robots in one selectors loop, and only
+the robots whose port became readable are read, framed, parsed and
+localized, all from a single thread. The same loop writes the commands
+of the robots it created, so a fleet of any size runs on one thread.
+"""
+import selectors
+import socket
+import sys
+from threading import Lock, Thread
+from time import thread_time
+
+from .commands import PolledCommandWriter
+from .eBot import eBot
+from .instrumentation import loop_counters, loop_summary
+
+
+class Fleet:
+    def __init__(self, select_timeout=0.1):
+        """
+        :param select_timeout: maximum idle wait of the I/O loop, in seconds
+        """
+        self.selector = selectors.DefaultSelector()
+        self.robots = {}   # name -> eBot
+        self.polled = {}   # robots without a pollable descriptor
+        self.errors = {}   # name -> exception that removed the robot
+        self.writers = {}  # name -> PolledCommandWriter written by the loop
+        self.select_timeout = select_timeout
+        # Wakes the loop up when a command is queued
+        self.waker, self.wake_socket = socket.socketpair()
+        for sock in (self.waker, self.wake_socket):
+            sock.setblocking(False)
+        self.selector.register(self.wake_socket, selectors.EVENT_READ, None)
+        self.lock = Lock()
+        self.running = False
+        self.thread = None
+        self.reset_loop_stats()
+        return
+
+    def __len__(self):
+        return len(self.robots)
+
+    def __getitem__(self, name):
+        return self.robots[name]
+
+    def __contains__(self, name):
+        return name in self.robots
+
+    def add(self, name, port_path=None, bot=None, **connect_kws):
+        """
+        Connects a robot and hands its port over to the I/O loop.
+
+        :param name: key of the robot in the fleet
+        :param port_path: port of the robot, as for eBot.connect
+        :param bot: eBot instance to use; a new one is created if None,
+            with its commands written by the I/O loop
+        :return: the eBot
+        """
+        if bot is None:
+            bot = eBot(async_commands=False)
+        if not bot.serialReady:
+            bot.connect(port_path, background=False, **connect_kws)
+        self.attach(name, bot)
+        return bot
+
+    def attach(self, name, bot):
+        """
+        Adds an already connected robot whose update thread is not running.
+        If it writes its commands synchronously (async_commands=False),
+        the I/O loop writes them from now on; a robot with its own
+        CommandWriter keeps that thread.
+        """
+        if bot.updating:
+            raise Exception("Robot {} runs its own update thread".format(name))
+        with self.lock:
+            if name in self.robots:
+                raise KeyError("Robot {} already in the fleet".format(name))
+            self.robots[name] = bot
+            fd = getattr(bot.port, 'fd', None)
+            if fd is not None:
+                self.selector.register(fd, selectors.EVENT_READ, name)
+            else:
+                self.polled[name] = bot
+            if bot.writer is None:
+                bot.writer = PolledCommandWriter(bot.port, bot.command_spacing,
+                                                 self._wake)
+                self.writers[name] = bot.writer
+        return
+
+    def remove(self, name, disconnect=True):
+        """
+        Takes a robot out of the fleet, halting and disconnecting it.
+
+        :return: the eBot, or None if it is not (or no longer) in the fleet
+        """
+        with self.lock:
+            bot = self.robots.pop(name, None)
+            if bot is None:
+                # Already removed, e.g. by the I/O loop after an error
+                return None
+            if self.polled.pop(name, None) is None:
+                try:
+                    self.selector.unregister(bot.port.fd)
+                except (KeyError, ValueError):
+                    pass
+            writer = self.writers.pop(name, None)
+        if disconnect:
+            try:
+                bot.halt()
+            except Exception:
+                pass
+            bot.disconnect()
+        elif writer is not None:
+            # Back to synchronous commands
+            writer.stop()
+            if bot.writer is writer:
+                bot.writer = None
+        return bot
+
+    def snapshots(self):
+        """
+        :rtype: dict
+        :return: latest Snapshot of every robot (None until its first
+                 frame is processed)
+        """
+        return {name: bot.snapshot for name, bot in self.robots.items()}
+
+    def positions(self):
+        """
+        :rtype: dict
+        :return: latest pose of every robot with a snapshot
+        """
+        return {name: snap.pose for name, snap in self.snapshots().items()
+                if snap is not None}
+
+    def poll(self, timeout=None):
+        """
+        One iteration of the I/O loop: waits until a port is readable (or
+        the timeout expires) and processes the new frames.
+
+        :return: number of frames processed
+        """
+        if timeout is None:
+            timeout = self.select_timeout
+        if self.polled:
+            timeout = min(timeout, 0.005)
+        delay = self.write_commands()
+        if delay is not None:
+            timeout = min(timeout, delay)
+        events = self.selector.select(timeout)
+        names = []
+        for key, mask in events:
+            if key.data is None:
+                self._drain_wakeups()
+            else:
+                names.append(key.data)
+        names.extend(self.polled)
+        processed = 0
+        for name in names:
+            bot = self.robots.get(name)
+            if bot is None:
+                continue
+            try:
+                if bot.update_all():
+                    processed += 1
+            except Exception as ex:
+                bot._fail(ex)
+                self.errors[name] = ex
+                sys.stderr.write("Robot {} removed from fleet: {}\n".format(
+                    name, ex))
+                self.remove(name, disconnect=False)
+        stats = self.loop_stats_values
+        stats['iterations'] += 1
+        stats['frames'] += processed
+        if not events:
+            stats['timeouts'] += 1
+        return processed
+
+    def write_commands(self):
+        """
+        Writes the next command of every robot whose spacing since its
+        previous command has elapsed.
+
+        :return: seconds until the next command is due, or None if no
+            command is queued
+        """
+        due = None
+        for writer in list(self.writers.values()):
+            delay = writer.poll()
+            if delay is not None and (due is None or delay < due):
+                due = delay
+        return due
+
+    def _wake(self):
+        try:
+            self.waker.send(b'\0')
+        except OSError:
+            pass  # full: the loop is already due to wake up
+        return
+
+    def _drain_wakeups(self):
+        try:
+            while self.wake_socket.recv(4096):
+                pass
+        except OSError:
+            pass
+        return
+
+    def run(self):
+        self.reset_loop_stats()
+        cpu0 = thread_time()
+        try:
+            while self.running:
+                self.poll()
+                self.loop_stats_values['cpu_time'] = thread_time() - cpu0
+        finally:
+            self.running = False
+        return
+
+    def start(self):
+        """
+        Runs the I/O loop in a background thread.
+        """
+        if not self.running:
+            self.running = True
+            self.thread = Thread(target=self.run)
+            self.thread.daemon = True
+            self.thread.start()
+        return
+
+    def stop(self, disconnect=False):
+        """
+        Stops the I/O loop thread.
+
+        :param disconnect: also halt and disconnect every robot
+        """
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(5)
+            self.thread = None
+        if disconnect:
+            for name in list(self.robots):
+                self.remove(name)
+        return
+
+    def close(self, disconnect=False):
+        """
+        Stops the I/O loop, takes every robot out of the fleet and releases
+        the selector. The fleet cannot be used afterwards.
+
+        :param disconnect: also halt and disconnect every robot; otherwise
+            they are handed back with synchronous commands
+        """
+        self.stop()
+        for name in list(self.robots):
+            self.remove(name, disconnect)
+        self.selector.close()
+        self.waker.close()
+        self.wake_socket.close()
+        return
+
+    def reset_loop_stats(self):
+        self.loop_stats_values = loop_counters()
+        return
+
+    def loop_stats(self):
+        """
+        Same counters as eBot.loop_stats, for the whole fleet.
+        """
+        return loop_summary(self.loop_stats_values)
@@ -0,0 +1,118 @@
+"""
+Fixed capacity history of telemetry frames and EKF poses.
+
+Frames are written into a preallocated structured NumPy array used as a
+ring buffer. Queries return the requested window in chronological order:
+a view when the window is contiguous in the ring, a single copy when it
+wraps around the end.
+"""
+from threading import Lock
+
+import numpy as np
+
+from .telemetry import FIELDS, POSE_FIELDS
+
+HISTORY_DTYPE = np.dtype([(name, np.float64) for name in FIELDS + POSE_FIELDS])
+
+
+class TelemetryHistory:
+    def __init__(self, capacity=4096):
+        """
+        :param capacity: number of frames kept; older frames are overwritten
+        """
+        self.capacity = int(capacity)
+        self.data = np.zeros(self.capacity, dtype=HISTORY_DTYPE)
+        self.count = 0  # frames written since creation or clear
+        self.lock = Lock()
+        return
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def clear(self):
+        with self.lock:
+            self.count = 0
+        return
+
+    def append(self, frame, pose):
+        """
+        :param frame: the 20 values of a frame, in telemetry.FIELDS order
+        :param pose: (x, y, heading) after the frame was processed
+        """
+        with self.lock:
+            self.data[self.count % self.capacity] = tuple(frame) + tuple(pose)
+            self.count += 1
+        return
+
+    def extend(self, frames, poses):
+        """
+        Appends many frames at once.
+
+        :param frames: (N,20) array, or structured array with the FIELDS
+        :param poses: (N,3) array of (x, y, heading)
+        """
+        frames = np.asarray(frames)
+        if frames.dtype.names:
+            frames = np.column_stack([frames[name] for name in FIELDS])
+        rows = np.column_stack([frames, np.asarray(poses, dtype=np.float64)])
+        total = len(rows)
+        rows = rows[-self.capacity:]
+        n = len(rows)
+        with self.lock:
+            start = (self.count + total - n) % self.capacity
+            first = min(n, self.capacity - start)
+            flat = self.data.view(np.float64).reshape(self.capacity, -1)
+            flat[start:start + first] = rows[:first]
+            flat[:n - first] = rows[first:]
+            self.count += total
+        return
+
+    def history(self, last_n=None, since=None):
+        """
+        Frames in chronological order.
+
+        :param last_n: only the newest last_n frames
+        :param since: only frames whose time_stamp is >= since (firmware
+            time, ms). Both limits can be combined.
+        :rtype: numpy.ndarray
+        :return: structured array with the fields in HISTORY_DTYPE. It is a
+            view into the ring buffer whenever possible, so copy it if it
+            has to outlive the next capacity frames.
+        """
+        with self.lock:
+            n = len(self)
+            end = self.count % self.capacity
+            if n < self.capacity or end == 0:
+                # Not wrapped yet, or the oldest frame is back at index 0
+                older, newer = self.data[:0], self.data[:n]
+            else:
+                older, newer = self.data[end:], self.data[:end]
+            if last_n is not None:
+                skip = max(n - int(last_n), 0)
+                older, newer = older[skip:], newer[max(skip - len(older), 0):]
+            if since is not None:
+                if len(newer) and newer['time_stamp'][0] >= since:
+                    older = older[np.searchsorted(older['time_stamp'], since):]
+                else:
+                    older = older[:0]
+                    newer = newer[np.searchsorted(newer['time_stamp'], since):]
+            if not len(older):
+                return newer
+            if not len(newer):
+                return older
+            return np.concatenate([older, newer])
+
+    def window(self, field, last_n=None, since=None):
+        """
+        :return: the values of one field over the window, see history
+        """
+        return self.history(last_n, since)[field]
+
+    def mean(self, field, last_n=None, since=None):
+        return self.window(field, last_n, since).mean()
+
+    def min(self, field, last_n=None, since=None):
+        return self.window(field, last_n, since).min()
+
+    def max(self, field, last_n=None, since=None):
+        return self.window(field, last_n, since).max()
@@ -0,0 +1,118 @@
+"""
+Low overhead timing of the telemetry pipeline.
+
+A PipelineStats collects, per stage, the durations measured by the
+instrumented code into a fixed-bucket histogram, plus plain counters.
+Instrumented objects hold a stats attribute that is None by default, so
+when timing is disabled each stage only costs an attribute check.
+
+Stages:
+    serial_read   reading the bytes buffered by the port (SafeSerial)
+    readline      SafeSerial.readline
+    serial_write  SafeSerial.write
+    lock_wait     waiting for the SafeSerial lock
+    read_all      eBot.read_all (serial read, framing and parsing)
+    parse         parsing the frame (all the frames of the block with catch_up)
+    gyro          gyro heading integration
+    update_state  Locator_EKF.update_state
+    process_block eBot.process_block, all the frames of a block (catch_up)
+    update_all    eBot.update_all, whole pipeline for one call
+Counters: frames_read, frames_skipped (read but not processed),
+frames_bad (malformed).
+
+loop_counters and loop_summary keep the always-on activity counters of
+the I/O loops (eBot.update_background and Fleet.run).
+"""
+from bisect import bisect_left
+from time import time
+
+# Upper bucket edges in seconds: 1 us, 2 us, 4 us ... ~1 s, then overflow
+BUCKET_EDGES = tuple(1e-6 * 2 ** k for k in range(21))
+
+
+class Histogram:
+    __slots__ = ('counts', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_EDGES) + 1)
+        self.count = 0
+        self.total = 0.
+        self.max = 0.
+
+    def record(self, seconds):
+        self.counts[bisect_left(BUCKET_EDGES, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def summary(self):
+        """
+        :return: dict with count, total, mean and max (s) and the non empty
+            buckets as [upper edge in s (None for overflow), count] pairs
+        """
+        edges = BUCKET_EDGES + (None,)
+        return {'count': self.count,
+                'total': self.total,
+                'mean': self.total / self.count if self.count else 0.,
+                'max': self.max,
+                'buckets': [[edge, n] for edge, n in zip(edges, self.counts)
+                            if n]}
+
+
+class PipelineStats:
+    def __init__(self):
+        self.reset()
+        return
+
+    def reset(self):
+        self.histograms = {}
+        self.counters = {}
+        return
+
+    def record(self, stage, seconds):
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            histogram = self.histograms[stage] = Histogram()
+        histogram.record(seconds)
+        return
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+        return
+
+    def summary(self):
+        """
+        :rtype: dict
+        :return: {'stages': {stage: Histogram.summary()}, 'counters': {...}}
+        """
+        return {'stages': {stage: histogram.summary() for stage, histogram
+                           in list(self.histograms.items())},
+                'counters': dict(self.counters)}
+
+
+def loop_counters():
+    """
+    :rtype: dict
+    :return: zeroed counters of an I/O loop, which the loop updates in
+        place: iterations, frames processed, idle waits that timed out
+        without data and CPU time used by its thread (s).
+    """
+    return {'iterations': 0, 'frames': 0, 'timeouts': 0, 'cpu_time': 0.,
+            'start_time': time()}
+
+
+def loop_summary(counters):
+    """
+    :param counters: dict from loop_counters
+    :rtype: dict
+    :return: the counters plus the wall time elapsed since they were
+        created (s) and cpu_usage, as a fraction of one core.
+    """
+    stats = dict(counters)
+    stats['wall_time'] = time() - stats.pop('start_time')
+    if stats['wall_time'] > 0:
+        stats['cpu_usage'] = stats['cpu_time'] / stats['wall_time']
+    else:
+        stats['cpu_usage'] = 0.
+    return stats
@@ -0,0 +1,306 @@
+"""
+Occupancy grid mapping from the ultrasonic sensors and the EKF pose.
+
+OccupancyGrid keeps the log-odds of every cell being occupied. Each
+update casts, for the six sensors at once, a few rays spread over the
+beam cone of every sensor: cells along the rays before the measured
+distance become more likely free, and cells at the measured distance
+more likely occupied. Readings at or beyond max_range only clear space.
+
+The grid is stored in square tiles allocated when the robot first sees
+them, so it needs no bounds. At most max_tiles tiles are kept; the least
+recently updated ones are dropped beyond that, which keeps memory bounded
+while the robot explores large areas.
+
+Usage:
+    grid = OccupancyGrid()
+    grid.attach(bot)  # updated with every frame
+    grid.nearest_obstacle(x, y, heading)
+
+sonar_points converts whole recordings of readings into world points at
+once, e.g. for scan matching or plotting.
+"""
+from collections import OrderedDict
+from math import radians
+from threading import Lock
+
+import numpy as np
+
+from .telemetry import SONAR_ANGLES, SONAR_FIELDS
+
+_HALF = 2 ** 31
+
+
+def cell_keys(ci, cj):
+    """
+    Packs integer cell (or tile) coordinates into one int64 per cell, so
+    they can be deduplicated and compared as 1-d arrays.
+    """
+    return ci * (2 * _HALF) + (cj + _HALF)
+
+
+def unpack_keys(keys):
+    return keys // (2 * _HALF), keys % (2 * _HALF) - _HALF
+
+
+def _unique(keys):
+    # Sorted unique keys; cheaper than np.unique for these small arrays
+    keys = np.sort(keys)
+    if len(keys) < 2:
+        return keys
+    return keys[np.concatenate(([True], keys[1:] != keys[:-1]))]
+
+
+def sonar_points(sonar, poses=None, angles=SONAR_ANGLES, max_range=2.5,
+                 min_range=0.02):
+    """
+    World coordinates of the points seen by the ultrasonic sensors, for N
+    frames at once.
+
+    :param sonar: structured array from eBot.history() (distances in mm,
+        poses in the x, y and heading fields), or (N,6) array of distances
+        in meters in the order of Snapshot.sonar
+    :param poses: (N,3) array of (x, y, heading in degrees); only with a
+        plain sonar array
+    :param angles: mounting direction of each sensor relative to the
+        heading (deg)
+    :param max_range: readings at or beyond this distance (m) are invalid
+    :param min_range: readings below this distance (m) are invalid
+    :return: ((N*6,2) array of points, frame major in the order of
+        SONAR_FIELDS, (N*6,) bool array, False for invalid readings).
+        points[valid] keeps only the real obstacles.
+    """
+    if poses is None:
+        ranges = np.column_stack([sonar[name] for name in SONAR_FIELDS])
+        ranges /= 1000.
+        x, y, heading = sonar['x'], sonar['y'], sonar['heading']
+    else:
+        ranges = np.asarray(sonar, dtype=float).reshape(-1, len(angles))
+        poses = np.asarray(poses, dtype=float).reshape(-1, 3)
+        x, y, heading = poses[:, 0], poses[:, 1], poses[:, 2]
+    theta = np.radians(heading)[:, None] + np.radians(angles)
+    points = np.empty(ranges.shape + (2,))
+    np.multiply(ranges, np.cos(theta), out=points[..., 0])
+    np.multiply(ranges, np.sin(theta), out=points[..., 1])
+    points[..., 0] += x[:, None]
+    points[..., 1] += y[:, None]
+    valid = (ranges >= min_range) & (ranges < max_range)
+    return points.reshape(-1, 2), valid.ravel()
+
+
+class OccupancyGrid:
+    def __init__(self, resolution=0.02, tile_size=64, max_tiles=1024,
+                 max_range=2.5, min_range=0.02, cone=15., beams=5,
+                 angles=SONAR_ANGLES, l_occupied=0.85, l_free=-0.4,
+                 l_min=-4., l_max=4.):
+        """
+        :param resolution: cell size (m)
+        :param tile_size: cells per tile side
+        :param max_tiles: tiles kept in memory, the least recently updated
+            ones are dropped beyond that
+        :param max_range: readings at or beyond this distance (m) are out
+            of range: only the space before it is cleared
+        :param min_range: readings below this distance (m) are ignored
+        :param cone: full width of the beam of a sensor (deg)
+        :param beams: rays cast per sensor over the cone
+        :param angles: mounting direction of each sensor relative to the
+            heading (deg), in the order of Snapshot.sonar
+        :param l_occupied: log-odds added to a cell seen occupied
+        :param l_free: log-odds added to a cell seen free
+        :param l_min: lower bound of the log-odds
+        :param l_max: upper bound of the log-odds
+        """
+        self.resolution = resolution
+        self.tile_size = tile_size
+        self.max_tiles = max_tiles
+        self.max_range = max_range
+        self.min_range = min_range
+        self.l_occupied = l_occupied
+        self.l_free = l_free
+        self.l_min = l_min
+        self.l_max = l_max
+        self.tiles = OrderedDict()  # (ti, tj) -> log-odds tile, LRU order
+        self.updates = 0
+        # attach updates the tiles from another thread than the queries
+        self.lock = Lock()
+        # Direction of every ray relative to the heading, sensor major
+        spread = np.linspace(-cone / 2., cone / 2., beams) if beams > 1 \
+            else np.zeros(1)
+        self.beams = beams
+        self.ray_angles = np.radians(
+            (np.asarray(angles, dtype=float)[:, None] + spread).ravel())
+        # Distances sampled along every ray, half a cell apart
+        self.steps = np.arange(0., max_range, resolution / 2.)
+        return
+
+    def __len__(self):
+        return len(self.tiles)
+
+    def clear(self):
+        with self.lock:
+            self.tiles.clear()
+            self.updates = 0
+        return
+
+    def _tile(self, key):
+        tile = self.tiles.get(key)
+        if tile is None:
+            tile = np.zeros((self.tile_size, self.tile_size),
+                            dtype=np.float32)
+            self.tiles[key] = tile
+            if len(self.tiles) > self.max_tiles:
+                self.tiles.popitem(last=False)
+        else:
+            self.tiles.move_to_end(key)
+        return tile
+
+    def cells(self, x, y):
+        """
+        :return: integer cell coordinates of world points (arrays)
+        """
+        return (np.floor(np.asarray(x) / self.resolution).astype(np.int64),
+                np.floor(np.asarray(y) / self.resolution).astype(np.int64))
+
+    def _add(self, keys, delta):
+        # keys: unique cells; grouped by tile, one fancy index per tile
+        size = self.tile_size
+        ci, cj = unpack_keys(keys)
+        ti = ci // size
+        tj = cj // size
+        tiles = cell_keys(ti, tj)
+        for key in _unique(tiles).tolist():
+            sel = tiles == key
+            ti0, tj0 = unpack_keys(key)
+            tile = self._tile((ti0, tj0))
+            li = ci[sel] - ti0 * size
+            lj = cj[sel] - tj0 * size
+            tile[li, lj] = np.clip(tile[li, lj] + delta, self.l_min,
+                                   self.l_max)
+        return
+
+    def update(self, pose, sonar):
+        """
+        Integrates one set of readings.
+
+        :param pose: (x, y, heading in degrees), as eBot.position()
+        :param sonar: the six distances in meters, as eBot.robot_uS()
+        """
+        x, y, heading = pose
+        ranges = np.repeat(np.asarray(sonar, dtype=float), self.beams)
+        valid = ranges >= self.min_range
+        hit = valid & (ranges < self.max_range)
+        theta = self.ray_angles + radians(heading)
+        c = np.cos(theta)
+        s = np.sin(theta)
+        # Free space: every sample before the reading, on every ray
+        half = self.resolution / 2.
+        free = valid[:, None] & \
+            (self.steps[None, :] < (ranges - half)[:, None])
+        d = np.broadcast_to(self.steps, free.shape)[free]
+        rays = np.nonzero(free)[0]
+        fi, fj = self.cells(x + d * c[rays], y + d * s[rays])
+        # Occupied: the end point of the rays that hit something
+        oi, oj = self.cells(x + ranges[hit] * c[hit],
+                            y + ranges[hit] * s[hit])
+        # One update per cell and frame; occupied wins over free
+        occupied = _unique(cell_keys(oi, oj))
+        free_cells = _unique(cell_keys(fi, fj))
+        if len(occupied):
+            free_cells = free_cells[~np.isin(free_cells, occupied,
+                                             assume_unique=True)]
+        with self.lock:
+            if len(occupied):
+                self._add(occupied, self.l_occupied)
+            if len(free_cells):
+                self._add(free_cells, self.l_free)
+            self.updates += 1
+        return
+
+    def update_snapshot(self, snapshot):
+        """
+        update from a telemetry Snapshot.
+        """
+        self.update(snapshot.pose, snapshot.sonar)
+        return
+
+    def attach(self, bot, threaded=True):
+        """
+        Updates the grid with every frame processed by bot (see
+        eBot.subscribe). With threaded the update runs off the update
+        thread, skipping frames if it falls behind.
+
+        :rtype: events.Subscription
+        """
+        return bot.subscribe(self.update_snapshot, threaded=threaded)
+
+    def log_odds(self, x, y):
+        """
+        :param x, y: world coordinates (m), scalars or arrays
+        :return: log-odds of the cells, 0 (unknown) where not mapped
+        """
+        ci, cj = self.cells(x, y)
+        ci = np.atleast_1d(ci)
+        cj = np.atleast_1d(cj)
+        size = self.tile_size
+        ti = ci // size
+        tj = cj // size
+        tiles = cell_keys(ti, tj)
+        out = np.zeros(ci.shape, dtype=np.float32)
+        with self.lock:
+            for key in _unique(tiles).tolist():
+                ti0, tj0 = unpack_keys(key)
+                tile = self.tiles.get((ti0, tj0))
+                if tile is None:
+                    continue
+                sel = tiles == key
+                out[sel] = tile[ci[sel] - ti0 * size, cj[sel] - tj0 * size]
+        return out if np.ndim(x) else out[0]
+
+    def probability(self, x, y):
+        """
+        :return: probability of the cells being occupied, 0.5 if unknown
+        """
+        return 1. / (1. + np.exp(-self.log_odds(x, y)))
+
+    def nearest_obstacle(self, x, y, angle, max_range=None, threshold=0.7):
+        """
+        Distance to the first cell likely occupied along a direction.
+
+        :param x, y: origin (m)
+        :param angle: direction in world coordinates (deg), e.g. the
+            heading of position() plus a sensor angle
+        :param max_range: search distance (m), max_range if None
+        :param threshold: occupancy probability considered an obstacle
+        :return: distance (m), or None if nothing is found
+        """
+        if max_range is None:
+            max_range = self.max_range
+        d = np.arange(0., max_range, self.resolution / 2.)
+        a = radians(angle)
+        odds = self.log_odds(x + d * np.cos(a), y + d * np.sin(a))
+        found = np.flatnonzero(odds >= np.log(threshold / (1. - threshold)))
+        if not len(found):
+            return None
+        return float(d[found[0]])
+
+    def to_array(self):
+        """
+        Dense copy of the mapped area, for display.
+
+        :return: (log-odds array indexed [i, j] with x along i, world
+            coordinates of the corner of cell [0, 0]); (None, None) if the
+            grid is empty
+        """
+        size = self.tile_size
+        with self.lock:
+            if not self.tiles:
+                return None, None
+            keys = np.array(list(self.tiles.keys()))
+            lo = keys.min(axis=0)
+            shape = (keys.max(axis=0) - lo + 1) * size
+            out = np.zeros(shape, dtype=np.float32)
+            for (ti, tj), tile in self.tiles.items():
+                i = (ti - lo[0]) * size
+                j = (tj - lo[1]) * size
+                out[i:i + size, j:j + size] = tile
+        return out, tuple(lo * size * self.resolution)
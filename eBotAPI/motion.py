@@ -0,0 +1,269 @@
+"""
+Closed-loop motion primitives.
+
+A controller turns every new Snapshot into wheel speeds. MotionTask runs
+one as a subscriber of the update pipeline (see eBot.subscribe), right
+after the EKF update of each frame, and only sends a wheels command when
+the quantized speeds the firmware receives change. The task is a handle
+that can be joined, awaited from asyncio or cancelled.
+
+Speeds are wheels() fractions in [-1, 1]; the controllers steer with a
+forward part u and a turning part w: LS = u - w, RS = u + w.
+"""
+import asyncio
+from concurrent.futures import Future, TimeoutError
+from math import atan2, cos, degrees, hypot, radians
+from threading import Lock, Timer
+from time import perf_counter
+
+
+def quantize_speed(speed):
+    """
+    :param speed: wheels() speed, clamped to [-1, 1]
+    :return: the integer sent to the firmware
+    """
+    if speed > 1:
+        speed = 1
+    elif speed < -1:
+        speed = -1
+    return int((speed + 2) * 100)
+
+
+def heading_error(target, heading):
+    """
+    :return: target - heading wrapped to [-180, 180) (deg)
+    """
+    return (target - heading + 180.) % 360. - 180.
+
+
+def _clip(value, limit):
+    return max(-limit, min(limit, value))
+
+
+class TurnTo:
+    def __init__(self, heading, tolerance=2., gain=1., max_turn=0.5,
+                 min_turn=0.05):
+        """
+        Turns in place to a heading.
+
+        :param heading: target heading (deg)
+        :param tolerance: done when within this many degrees
+        :param gain: turning speed per radian of error
+        :param max_turn: largest turning speed
+        :param min_turn: smallest turning speed, to overcome friction
+        """
+        self.heading = heading
+        self.tolerance = tolerance
+        self.gain = gain
+        self.max_turn = max_turn
+        self.min_turn = min_turn
+        return
+
+    def step(self, snapshot):
+        """
+        :return: (LS, RS), or None once the target is reached
+        """
+        error = heading_error(self.heading, snapshot.heading)
+        if abs(error) <= self.tolerance:
+            return None
+        w = _clip(self.gain * radians(error), self.max_turn)
+        if abs(w) < self.min_turn:
+            w = self.min_turn if w > 0 else -self.min_turn
+        return -w, w
+
+
+class DriveTo:
+    def __init__(self, x, y, tolerance=0.02, speed=0.6, gain=3., turn_gain=1.,
+                 max_turn=0.5):
+        """
+        Drives to a point, turning towards it while moving. The forward
+        speed drops as the robot points away from the target and near it.
+
+        :param tolerance: done when closer than this (m)
+        :param speed: largest forward speed
+        :param gain: forward speed per meter of distance
+        :param turn_gain: turning speed per radian of heading error
+        :param max_turn: largest turning speed
+        """
+        self.x = x
+        self.y = y
+        self.tolerance = tolerance
+        self.speed = speed
+        self.gain = gain
+        self.turn_gain = turn_gain
+        self.max_turn = max_turn
+        return
+
+    def command(self, snapshot, x, y, slow_down=True):
+        dx = x - snapshot.x
+        dy = y - snapshot.y
+        distance = hypot(dx, dy)
+        error = radians(heading_error(degrees(atan2(dy, dx)),
+                                      snapshot.heading))
+        w = _clip(self.turn_gain * error, self.max_turn)
+        u = self.speed
+        if slow_down:
+            u = min(u, self.gain * distance)
+        u *= max(cos(error), 0.)
+        return distance, (u - w, u + w)
+
+    def step(self, snapshot):
+        distance, speeds = self.command(snapshot, self.x, self.y)
+        if distance <= self.tolerance:
+            return None
+        return speeds
+
+
+class FollowPath(DriveTo):
+    def __init__(self, points, lookahead=0.1, **kws):
+        """
+        Drives through a list of (x, y) points without stopping at the
+        intermediate ones: the next point becomes the target once the
+        current one is closer than lookahead (m).
+
+        :param kws: see DriveTo
+        """
+        self.points = [tuple(p) for p in points]
+        self.index = 0
+        self.lookahead = lookahead
+        x, y = self.points[-1] if self.points else (0., 0.)
+        DriveTo.__init__(self, x, y, **kws)
+        return
+
+    def step(self, snapshot):
+        points = self.points
+        while self.index < len(points):
+            x, y = points[self.index]
+            last = self.index == len(points) - 1
+            distance, speeds = self.command(snapshot, x, y, slow_down=last)
+            if distance > (self.tolerance if last else self.lookahead):
+                return speeds
+            self.index += 1
+        return None
+
+
+class MotionTask:
+    def __init__(self, bot, controller, timeout=None):
+        """
+        Runs controller on bot until it finishes, is cancelled or timeout
+        (s) expires. Use eBot.drive_to / turn_to / follow_path rather than
+        creating it directly.
+
+        The timeout is enforced by a timer, so the motion also ends if the
+        telemetry stalls.
+        """
+        self.bot = bot
+        self.controller = controller
+        self.timeout = timeout
+        self.future = Future()
+        self.lock = Lock()  # steps, the timer and cancel race to finish
+        self.sent = None  # quantized (left, right) last sent
+        self.commands = 0
+        self.steps = 0
+        self.start_time = perf_counter()
+        self.timer = None
+        if timeout is not None:
+            self.timer = Timer(timeout, self._expire)
+            self.timer.daemon = True
+            self.timer.start()
+        self.subscription = bot.subscribe(self.step)
+        return
+
+    def step(self, snapshot):
+        with self.lock:
+            if self.future.done():
+                return
+            try:
+                speeds = self.controller.step(snapshot)
+            except Exception as ex:
+                self._finish(ex)
+                return
+            self.steps += 1
+            if speeds is None:
+                self._finish()
+            else:
+                self._wheels(*speeds)
+        return
+
+    def _expire(self):
+        with self.lock:
+            if not self.future.done():
+                self._finish(TimeoutError(
+                    "Motion did not finish in {} s".format(self.timeout)))
+        return
+
+    def _wheels(self, LS, RS):
+        command = (quantize_speed(LS), quantize_speed(RS))
+        if command != self.sent:
+            self.sent = command
+            self.commands += 1
+            self.bot.wheels(LS, RS)
+        return
+
+    def _finish(self, error=None):
+        # Called with the lock held
+        self.subscription.cancel()
+        if self.timer is not None:
+            self.timer.cancel()
+        if self.sent is not None:
+            try:
+                self._wheels(0., 0.)
+            except Exception as ex:
+                # e.g. connection lost: still resolve the future
+                error = error or ex
+        if self.future.set_running_or_notify_cancel():
+            if error is None:
+                self.future.set_result(self)
+            else:
+                self.future.set_exception(error)
+        return
+
+    def cancel(self):
+        """
+        Stops the motion and the robot.
+
+        :return: False if it had already finished
+        """
+        with self.lock:
+            if self.future.done():
+                return False
+            self.subscription.cancel()
+            if self.timer is not None:
+                self.timer.cancel()
+            try:
+                if self.sent is not None:
+                    self._wheels(0., 0.)
+            finally:
+                self.future.cancel()
+            return True
+
+    def done(self):
+        return self.future.done()
+
+    def join(self, timeout=None):
+        """
+        Waits for the motion to finish.
+
+        :return: True if it finished, False if it was cancelled or is still
+            running after timeout
+        :raise: the error that stopped it (e.g. TimeoutError)
+        """
+        try:
+            self.future.result(timeout)
+        except TimeoutError:
+            if not self.future.done():
+                return False
+            raise
+        except Exception:
+            if self.future.cancelled():
+                return False
+            raise
+        return True
+
+    def __await__(self):
+        return asyncio.wrap_future(self.future).__await__()
+
+    def stats(self):
+        return {'steps': self.steps, 'commands': self.commands,
+                'elapsed': perf_counter() - self.start_time,
+                'done': self.future.done()}
@@ -0,0 +1,188 @@
+"""
+Recording and replay of raw telemetry.
+
+TelemetryRecorder appends every raw frame received to a compact binary
+log, together with the host time at which it was read. TelemetryLog
+reads such a log through mmap, so logs of any size can be scanned without
+loading them, and ReplayPort feeds it back to an eBot in place of its
+serial port, faster than real time if wanted.
+
+Log layout: the 8 byte MAGIC header followed by records of
+[host time: float64][size: uint16][frame: size bytes, without b'\\n'],
+little endian.
+"""
+import mmap
+import struct
+from threading import Lock
+from time import perf_counter, sleep, time
+
+from .telemetry import split_frames
+
+MAGIC = b'EBOTLOG\x01'
+RECORD_HEADER = struct.Struct('<dH')
+
+
+class TelemetryRecorder:
+    def __init__(self, path, buffering=1 << 16):
+        """
+        :param path: log file; frames are appended if it already exists
+        """
+        self.path = path
+        # close may be called from another thread than write_block
+        self.lock = Lock()
+        self.file = open(path, 'ab', buffering)
+        if self.file.tell() == 0:
+            self.file.write(MAGIC)
+        self.frames = 0
+        return
+
+    def write_block(self, block, host_time=None):
+        """
+        Appends every frame of a block, as returned by
+        FrameReader.pop_block, with the same host time. Does nothing once
+        the recorder is closed.
+        """
+        if host_time is None:
+            host_time = time()
+        pack = RECORD_HEADER.pack
+        frames = split_frames(block)
+        records = b''.join([pack(host_time, len(frame)) + frame
+                            for frame in frames])
+        with self.lock:
+            if self.file.closed:
+                return
+            self.file.write(records)
+            self.frames += len(frames)
+        return
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+        return
+
+
+class TelemetryLog:
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError("{} is not a telemetry log".format(path))
+        return
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def __iter__(self):
+        """
+        Yields (host time, frame) for every record.
+        """
+        data = self.map
+        unpack = RECORD_HEADER.unpack_from
+        size = RECORD_HEADER.size
+        pos = len(MAGIC)
+        end = len(data)
+        while pos + size <= end:
+            host_time, n = unpack(data, pos)
+            pos += size
+            if pos + n > end:
+                break  # truncated last record
+            yield host_time, data[pos:pos + n]
+            pos += n
+        return
+
+    def blocks(self):
+        """
+        Yields (host time, block) with the frames that were read together,
+        as they came out of FrameReader.pop_block.
+        """
+        current = None
+        frames = []
+        for host_time, frame in self:
+            if host_time != current and frames:
+                yield current, b'\n'.join(frames) + b'\n'
+                frames = []
+            current = host_time
+            frames.append(frame)
+        if frames:
+            yield current, b'\n'.join(frames) + b'\n'
+        return
+
+
+class ReplayPort:
+    """
+    Read-only stand-in for SafeSerial that returns the blocks of a log,
+    one per read, as they were originally received.
+    """
+    def __init__(self, log, speed=None):
+        """
+        :param log: TelemetryLog
+        :param speed: replay speed relative to the recording (e.g. 100);
+            None replays as fast as possible
+        """
+        self.log = log
+        self.speed = speed
+        self.blocks = log.blocks()
+        self.exhausted = False
+        self.start = None
+        return
+
+    def read_available(self):
+        if self.exhausted:
+            return b''
+        try:
+            host_time, block = next(self.blocks)
+        except StopIteration:
+            self.exhausted = True
+            return b''
+        if self.speed:
+            if self.start is None:
+                self.start = (host_time, perf_counter())
+            due = self.start[1] + (host_time - self.start[0]) / self.speed
+            delay = due - perf_counter()
+            if delay > 0:
+                sleep(delay)
+        return block
+
+    def wait_readable(self, timeout):
+        return not self.exhausted
+
+    def write(self, message):
+        return len(message)
+
+    def flushInput(self):
+        return
+
+    def flushOutput(self):
+        return
+
+    def close(self):
+        return
+
+
+def replay(bot, path, speed=None):
+    """
+    Feeds a recorded log through an eBot that is not connected: frames
+    go through update_all exactly as they did live, offsets included.
+
+    :param bot: eBot to update
+    :param path: log file
+    :param speed: see ReplayPort
+    :return: number of frames processed
+    """
+    processed = bot.frame_counts['processed']
+    with TelemetryLog(path) as log:
+        bot.port = port = ReplayPort(log, speed)
+        while not port.exhausted:
+            bot.update_all()
+    return bot.frame_counts['processed'] - processed
@@ -0,0 +1,308 @@
+"""
+Publishing of the telemetry in shared memory, for other local processes.
+
+The process that owns the eBot writes every processed frame, with the
+pose estimated after it, into a ring of records in a named
+multiprocessing.shared_memory segment. Any number of processes attach to
+it by name and read the latest frame or the recent history without
+talking to the owner.
+
+Layout: a 128 byte header (magic, sequence counter, capacity, frames
+written, closed flag, frames being written and IMU offsets) followed by
+capacity records of history.HISTORY_DTYPE (the telemetry FIELDS plus x,
+y and heading).
+
+Consistency is kept with a seqlock: the writer makes the sequence
+counter odd while it updates the segment and even again when done.
+Readers copy what they need and retry if the counter was odd or changed
+meanwhile, so they never block the writer. History reads only retry if
+the writer wrapped around the ring into the copied window. Python has no
+memory barriers, so this relies on the total store order of x86(-64)
+CPUs; create refuses to run on other CPUs (e.g. ARM), where readers
+could see torn records without noticing.
+
+Usage:
+    bot.share('ebot1')                      # owner process
+    shared = SharedTelemetry.attach('ebot1')  # any other process
+    shared.pose(), shared.snapshot(), shared.history(100)
+"""
+import platform
+import sys
+from multiprocessing import shared_memory
+from threading import Lock
+from time import sleep, perf_counter
+
+import numpy as np
+
+from .history import HISTORY_DTYPE
+from .telemetry import N_FIELDS, Snapshot
+
+MAGIC = b'EBOTSHM1'
+HEADER_SIZE = 128
+# Offsets in the header of the uint64 fields and of the float64 offsets
+_SEQ, _CAPACITY, _COUNT, _CLOSED, _WRITING = 1, 2, 3, 4, 5
+_OFFSETS = 48
+# Segments created by this process, already handled by its resource tracker
+_created = set()
+# CPUs with total store order, see the module doc
+TSO_MACHINES = ('x86_64', 'amd64', 'x86', 'i386', 'i486', 'i586', 'i686')
+
+
+class SharedTelemetry:
+    def __init__(self, shm, owner):
+        """
+        Use create or attach.
+        """
+        self.shm = shm
+        self.owner = owner
+        self.name = shm.name
+        self.lock = Lock()  # publish and close may run in different threads
+        buf = shm.buf
+        if bytes(buf[:8]) != MAGIC:
+            raise ValueError("{} is not an eBot telemetry segment".format(
+                shm.name))
+        self.header = np.ndarray((6,), dtype='<u8', buffer=buf)
+        self.offsets = np.ndarray((6,), dtype='<f8', buffer=buf,
+                                  offset=_OFFSETS)
+        self.capacity = int(self.header[_CAPACITY])
+        # Zero-copy views of the ring; see the module doc before reading
+        # them directly
+        self.ring = np.ndarray((self.capacity,), dtype=HISTORY_DTYPE,
+                               buffer=buf, offset=HEADER_SIZE)
+        self.flat = self.ring.view(np.float64).reshape(self.capacity, -1)
+        return
+
+    @classmethod
+    def create(cls, name=None, capacity=4096):
+        """
+        Creates a new segment, owned by the caller.
+
+        :param name: segment name, chosen by the system if None
+        :param capacity: frames kept in the ring
+        :raise RuntimeError: the CPU does not order stores (not x86)
+        """
+        machine = platform.machine()
+        if machine.lower() not in TSO_MACHINES:
+            raise RuntimeError("Shared telemetry needs an x86 CPU, not {}"
+                               .format(machine or "an unknown one"))
+        size = HEADER_SIZE + capacity * HISTORY_DTYPE.itemsize
+        shm = shared_memory.SharedMemory(name, create=True, size=size)
+        _created.add(shm.name)
+        shm.buf[:8] = MAGIC
+        header = np.ndarray((6,), dtype='<u8', buffer=shm.buf)
+        header[1:] = 0
+        header[_CAPACITY] = capacity
+        del header
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name):
+        """
+        Opens the segment published by another process.
+        """
+        if sys.version_info >= (3, 13):
+            shm = shared_memory.SharedMemory(name, track=False)
+        else:
+            shm = shared_memory.SharedMemory(name)
+            # Before 3.13 the resource tracker would destroy the segment
+            # when this reader exits
+            if shm.name not in _created:
+                from multiprocessing import resource_tracker
+                resource_tracker.unregister(shm._name, 'shared_memory')
+        return cls(shm, owner=False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # Writer side
+
+    def publish(self, frame, pose, offsets):
+        """
+        Appends one frame.
+
+        :param frame: the 20 values of the frame
+        :param pose: (x, y, heading) after the frame
+        :param offsets: current IMU offsets
+        """
+        with self.lock:
+            header = self.header
+            if header is None:
+                return  # closed
+            count = int(header[_COUNT])
+            row = self.flat[count % self.capacity]
+            header[_SEQ] += 1
+            header[_WRITING] = count + 1
+            row[:N_FIELDS] = frame
+            row[N_FIELDS:] = pose
+            self.offsets[:] = offsets
+            header[_COUNT] = count + 1
+            header[_SEQ] += 1
+            # close() can only release the mapping once no view is left
+            del header, row
+        return
+
+    def publish_block(self, frames, poses, offsets):
+        """
+        Appends many frames at once.
+
+        :param frames: (N,20) array or list of frames
+        :param poses: (N,3) array of poses
+        """
+        rows = np.column_stack([np.asarray(frames, dtype=np.float64),
+                                np.asarray(poses, dtype=np.float64)])
+        with self.lock:
+            header = self.header
+            if header is None:
+                return  # closed
+            count = int(header[_COUNT])
+            total = len(rows)
+            rows = rows[-self.capacity:]
+            n = len(rows)
+            start = (count + total - n) % self.capacity
+            first = min(n, self.capacity - start)
+            header[_SEQ] += 1
+            header[_WRITING] = count + total
+            self.flat[start:start + first] = rows[:first]
+            self.flat[:n - first] = rows[first:]
+            self.offsets[:] = offsets
+            header[_COUNT] = count + total
+            header[_SEQ] += 1
+            del header
+        return
+
+    # Reader side
+
+    @property
+    def count(self):
+        """
+        Frames published since the segment was created.
+        """
+        return int(self.header[_COUNT])
+
+    @property
+    def closed(self):
+        """
+        True once the owner has stopped publishing.
+        """
+        return bool(self.header[_CLOSED])
+
+    def latest(self, retries=1000):
+        """
+        :return: (record, offsets) copies of the newest frame and the IMU
+            offsets, or None if nothing was published yet
+        :raise RuntimeError: no consistent read after retries attempts
+        """
+        header = self.header
+        for i in range(retries):
+            seq = int(header[_SEQ])
+            if seq & 1:
+                sleep(0)
+                continue
+            count = int(header[_COUNT])
+            if not count:
+                return None
+            record = self.ring[(count - 1) % self.capacity].copy()
+            offsets = tuple(self.offsets.tolist())
+            if int(header[_SEQ]) == seq:
+                return record, offsets
+        raise RuntimeError("No consistent read of {}".format(self.name))
+
+    def snapshot(self):
+        """
+        :rtype: Snapshot
+        :return: Snapshot of the newest frame, as eBot.snapshot, or None
+        """
+        latest = self.latest()
+        if latest is None:
+            return None
+        record, offsets = latest
+        values = record.tolist()
+        return Snapshot.from_frame(values[:N_FIELDS], values[N_FIELDS:],
+                                   offsets)
+
+    def pose(self, retries=1000):
+        """
+        :return: (x, y, heading in degrees) after the newest frame, or
+            None
+        """
+        header = self.header
+        for i in range(retries):
+            seq = int(header[_SEQ])
+            if seq & 1:
+                sleep(0)
+                continue
+            count = int(header[_COUNT])
+            if not count:
+                return None
+            pose = self.flat[(count - 1) % self.capacity,
+                             N_FIELDS:].tolist()
+            if int(header[_SEQ]) == seq:
+                return tuple(pose)
+        raise RuntimeError("No consistent read of {}".format(self.name))
+
+    def history(self, last_n=None, retries=100):
+        """
+        Copy of the newest frames in chronological order.
+
+        :param last_n: number of frames, all those in the ring if None
+        :rtype: numpy.ndarray
+        :return: structured array, as eBot.history()
+        """
+        header = self.header
+        capacity = self.capacity
+        for i in range(retries):
+            count = int(header[_COUNT])
+            n = min(count, capacity)
+            if last_n is not None:
+                n = min(n, last_n)
+            start = (count - n) % capacity
+            if start + n <= capacity:
+                out = self.ring[start:start + n].copy()
+            else:
+                out = np.concatenate([self.ring[start:],
+                                      self.ring[:start + n - capacity]])
+            # Slots written since count was read, including those in
+            # progress, must not reach the copied window
+            if int(header[_WRITING]) - count <= capacity - n:
+                return out
+            sleep(0)
+        raise RuntimeError("No consistent read of {}".format(self.name))
+
+    def wait(self, count, timeout=None, interval=0.001):
+        """
+        Waits until more than count frames have been published.
+
+        :return: the new count, or None on timeout or if the owner closed
+            the segment
+        """
+        deadline = None if timeout is None else perf_counter() + timeout
+        header = self.header
+        while int(header[_COUNT]) <= count:
+            if header[_CLOSED] or \
+                    (deadline is not None and perf_counter() > deadline):
+                return None
+            sleep(interval)
+        return int(header[_COUNT])
+
+    def close(self):
+        """
+        Detaches from the segment. The owner also marks it as closed and
+        destroys it; readers keep their mapping until they close.
+        """
+        with self.lock:
+            if self.shm is None:
+                return
+            if self.owner:
+                self.header[_CLOSED] = 1
+            # Views must go before the mapping can be released
+            self.header = self.offsets = self.ring = self.flat = None
+            shm = self.shm
+            self.shm = None
+        shm.close()
+        if self.owner:
+            shm.unlink()
+            _created.discard(shm.name)
+        return
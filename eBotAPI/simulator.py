@@ -0,0 +1,266 @@
+"""
+Simulated eBot on a pseudo-terminal (POSIX only).
+
+The simulator opens a pty and speaks the serial protocol used by eBot:
+it answers the connection handshake, streams telemetry frames at a
+configurable rate once told to, and drives a differential-drive
+kinematic model from the wheel commands. eBot.connect(port_path=...)
+runs against Simulator.port_path unmodified.
+
+From a shell: python -m eBotAPI.simulator --rate 1000
+"""
+import os
+import pty
+import select
+import sys
+import tty
+from collections import deque
+from math import cos, sin, degrees, radians, inf
+from threading import Thread, Lock
+from time import perf_counter, sleep
+
+import numpy as np
+
+from .telemetry import SONAR_ANGLES
+
+GYRO_SCALE = 130.5  # raw gyro units per deg/s, as used by eBot
+
+
+class Simulator:
+    def __init__(self, rate=100., pos=(0., 0.), heading=0., max_speed=0.3,
+                 wheel_distance=0.1, arena=2.0, sonar_range=4.0,
+                 gyro_bias=(12., -7., 30.), noise=0., seed=None,
+                 log_emissions=False):
+        """
+        :param rate: telemetry frames per second
+        :param pos: initial position (m)
+        :param heading: initial heading (rad)
+        :param max_speed: wheel speed for a wheels() command of 1 (m/s)
+        :param wheel_distance: distance between the wheels (m)
+        :param arena: half side of the square arena walls around the
+            origin that the ultrasonic sensors see (m)
+        :param sonar_range: readings beyond this are reported as the range
+        :param gyro_bias: raw bias of the Gx, Gy and Gz channels
+        :param noise: standard deviation of the raw gyro/accelerometer noise
+        :param log_emissions: record (time_stamp, perf_counter()) of every
+            frame written in emissions, for latency measurements
+        """
+        self.rate = float(rate)
+        self.x, self.y = pos
+        self.heading = heading
+        self.max_speed = max_speed
+        self.l = wheel_distance
+        self.arena = arena
+        self.sonar_range = sonar_range
+        self.gyro_bias = gyro_bias
+        self.noise = noise
+        self.rng = np.random.default_rng(seed)
+        self.left = 0.   # wheel speeds (m/s)
+        self.right = 0.
+        self.led = False
+        self.streaming = False
+        self.running = False
+        self.master = None
+        self.slave = None
+        self.port_path = None
+        self.lock = Lock()
+        self.frames_sent = 0
+        self.commands = {}  # command -> times received
+        self.time_ms = 0.
+        self.emissions = deque(maxlen=100000) if log_emissions else None
+        return
+
+    def start(self):
+        """
+        Opens the pty and starts answering; returns the port path.
+        """
+        self.master, self.slave = pty.openpty()
+        tty.setraw(self.master)
+        tty.setraw(self.slave)
+        self.port_path = os.ttyname(self.slave)
+        self.running = True
+        self.threads = [Thread(target=self._read_commands),
+                        Thread(target=self._stream)]
+        for thread in self.threads:
+            thread.daemon = True
+            thread.start()
+        return self.port_path
+
+    def stop(self):
+        self.running = False
+        for thread in self.threads:
+            thread.join(1.)
+        os.close(self.master)
+        os.close(self.slave)
+        return
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    def pose(self):
+        """
+        :return: true (x, y, heading in rad) of the simulated robot
+        """
+        with self.lock:
+            return self.x, self.y, self.heading
+
+    # Protocol
+    def _write(self, data):
+        try:
+            os.write(self.master, data)
+        except OSError:
+            self.running = False
+        return
+
+    def _read_commands(self):
+        buf = b''
+        while self.running:
+            r, _, _ = select.select([self.master], [], [], 0.05)
+            if not r:
+                continue
+            try:
+                buf += os.read(self.master, 4096)
+            except OSError:
+                return
+            buf = self._handle_commands(buf)
+        return
+
+    def _handle_commands(self, buf):
+        """
+        Executes every complete command in buf and returns the rest. The
+        commands are not delimited: '<<1X' handshake requests and 'F' have
+        fixed sizes, '2X' commands are two characters long and any other
+        command starts with chr(48 + n) followed by n characters.
+        """
+        while buf:
+            if buf[:1] == b'<':
+                size = 4
+            elif buf[:1] in (b'2', b'F'):
+                size = 2 if buf[:1] == b'2' else 1
+            else:
+                size = 1 + buf[0] - 48
+            if size < 1 or len(buf) < size:
+                break
+            command, buf = buf[:size].decode(errors='replace'), buf[size:]
+            self._execute(command)
+        return buf
+
+    def _execute(self, command):
+        name = command[:4] if command.startswith('<<') else command[:2]
+        self.commands[name] = self.commands.get(name, 0) + 1
+        if command == '<<1?':
+            self._write(b'eBot\n')
+        elif command == '<<1E':
+            self._write(b'>>1B\n')
+        elif command == '<<1O':
+            self._write(b'>>\n')
+        elif command == 'F':
+            self.streaming = True
+        elif command == '2C':
+            self._write(b'1000;1000;1000;1000;1000;1000;1000;1000;1000;'
+                        b'1000\n')
+        elif command == '2H':
+            with self.lock:
+                self.left = self.right = 0.
+            self.led = False
+        elif command == '2L':
+            self.led = True
+        elif command == '2l':
+            self.led = False
+        elif command[1:2] == 'w':
+            left, right = command[2:].split(';')
+            with self.lock:
+                self.left = (int(left) / 100. - 2) * self.max_speed
+                self.right = (int(right) / 100. - 2) * self.max_speed
+        return
+
+    # Telemetry
+    def _stream(self):
+        period = 1. / self.rate
+        start = perf_counter()
+        sent = 0
+        while self.running:
+            if not self.streaming:
+                sleep(0.001)
+                start = perf_counter()
+                sent = 0
+                continue
+            due = int((perf_counter() - start) / period) + 1
+            if due > sent:
+                self._write(b''.join([self._frame(period)
+                                      for i in range(due - sent)]))
+                if self.emissions is not None:
+                    self.emissions.append((round(self.time_ms, 3),
+                                           perf_counter()))
+                self.frames_sent += due - sent
+                sent = due
+            sleep(min(period, 0.001))
+        return
+
+    def _sonar(self, x, y, heading):
+        # Distance to the arena walls along each sensor direction, in mm
+        values = []
+        for angle in SONAR_ANGLES:
+            a = heading + radians(angle)
+            c, s = cos(a), sin(a)
+            d = inf
+            if c > 1e-9:
+                d = min(d, (self.arena - x) / c)
+            elif c < -1e-9:
+                d = min(d, (-self.arena - x) / c)
+            if s > 1e-9:
+                d = min(d, (self.arena - y) / s)
+            elif s < -1e-9:
+                d = min(d, (-self.arena - y) / s)
+            values.append(min(max(d, 0.), self.sonar_range) * 1000)
+        return values
+
+    def _frame(self, dt):
+        with self.lock:
+            vl, vr = self.left, self.right
+            v = (vr + vl) / 2
+            omega = (vr - vl) / self.l
+            self.x += dt * v * cos(self.heading)
+            self.y += dt * v * sin(self.heading)
+            self.heading += dt * omega
+            x, y, heading = self.x, self.y, self.heading
+        self.time_ms += dt * 1000
+        noise = self.rng.normal(0., self.noise, 6) if self.noise else \
+            (0.,) * 6
+        gx, gy, gz = self.gyro_bias
+        imu = (noise[0], noise[1], 16384 + noise[2], gx + noise[3],
+               gy + noise[4], gz + degrees(omega) * GYRO_SCALE + noise[5])
+        rl, l, f, r, rr, b = self._sonar(x, y, heading)
+        values = (self.time_ms,) + imu + (rr, r, f, l, rl, b,
+                                          vr * 1000, vl * 1000,
+                                          512, 300, 25, 7.4, 0.35)
+        return (';'.join(['{:.3f}'.format(v) for v in values]) +
+                '\n').encode()
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rate', type=float, default=100.,
+                        help='telemetry frames per second')
+    parser.add_argument('--noise', type=float, default=0.)
+    args = parser.parse_args(argv)
+    sim = Simulator(rate=args.rate, noise=args.noise)
+    print(sim.start())
+    sys.stdout.flush()
+    try:
+        while sim.running:
+            sleep(1.)
+    except KeyboardInterrupt:
+        pass
+    sim.stop()
+    return
+
+
+if __name__ == '__main__':
+    main()
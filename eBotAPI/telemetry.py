@@ -0,0 +1,305 @@
+"""
+Telemetry framing and parsing for the eBot serial stream.
+
+The firmware streams one ';' separated frame of 20 values per line, about
+105 bytes each. FrameReader pulls everything the port has buffered with a
+single read, keeps a partial trailing frame for the next call and hands
+the complete frames over as one contiguous block. parse_frame and
+parse_block turn frames into floats without going through str.
+"""
+from collections import namedtuple
+
+import numpy as np
+
+# Field order of a telemetry frame, as unpacked by eBot.update_all
+FIELDS = ('time_stamp', 'Ax', 'Ay', 'Az', 'Gx', 'Gy', 'Gz',
+          'Ultrasonic_rear_right', 'Ultrasonic_right', 'Ultrasonic_front',
+          'Ultrasonic_left', 'Ultrasonic_rear_left', 'Ultrasonic_back',
+          'encoder_right', 'encoder_left', 'LDR_top', 'LDR_front',
+          'temperature_sensor', 'voltage', 'current')
+N_FIELDS = len(FIELDS)
+FRAME_DTYPE = np.dtype([(name, np.float64) for name in FIELDS])
+# Estimated pose stored next to every frame
+POSE_FIELDS = ('x', 'y', 'heading')
+# Ultrasonic sensors in the order of Snapshot.sonar / eBot.robot_uS, and
+# their default mounting direction relative to the robot heading (deg,
+# counter-clockwise)
+SONAR_FIELDS = ('Ultrasonic_rear_left', 'Ultrasonic_left', 'Ultrasonic_front',
+                'Ultrasonic_right', 'Ultrasonic_rear_right', 'Ultrasonic_back')
+SONAR_ANGLES = (135., 90., 0., -90., -135., 180.)
+
+_POW10 = 10.0 ** np.arange(17)
+
+
+class FrameReader:
+    def __init__(self, max_partial=4096):
+        """
+        :param max_partial: a trailing partial frame longer than this many
+            bytes is considered garbage and dropped.
+        """
+        self.buf = bytearray()
+        self.max_partial = max_partial
+        self.frames_read = 0
+        self.bytes_read = 0
+        return
+
+    def clear(self):
+        """
+        Drops any buffered partial frame.
+        """
+        del self.buf[:]
+        return
+
+    def fill(self, port):
+        """
+        Reads everything available on the port in one call.
+
+        :param port: a SafeSerial (or any object with read_available)
+        :return: number of bytes read
+        """
+        data = port.read_available()
+        if data:
+            self.buf += data
+            self.bytes_read += len(data)
+        return len(data)
+
+    def feed(self, data):
+        """
+        Appends raw bytes received by other means to the buffer.
+        """
+        self.buf += data
+        self.bytes_read += len(data)
+        return
+
+    def pop_block(self):
+        """
+        Removes every complete frame from the buffer.
+
+        :rtype: bytes
+        :return: block with the complete frames, each one terminated by
+            b'\\n', or b'' if no frame is complete yet.
+        """
+        buf = self.buf
+        end = buf.rfind(b'\n') + 1
+        if not end:
+            if len(buf) > self.max_partial:
+                self.clear()
+            return b''
+        with memoryview(buf) as mv:
+            block = mv[:end].tobytes()
+        del buf[:end]
+        self.frames_read += block.count(b'\n')
+        return block
+
+    def read(self, port):
+        """
+        fill followed by pop_block.
+        """
+        self.fill(port)
+        return self.pop_block()
+
+
+def last_frame(block):
+    """
+    :param block: block of frames as returned by FrameReader.pop_block
+    :return: the last frame in the block without its b'\\n', or b''
+    """
+    if not block:
+        return b''
+    return block[block.rfind(b'\n', 0, len(block) - 1) + 1:-1]
+
+
+def split_frames(block):
+    """
+    :param block: block of frames as returned by FrameReader.pop_block
+    :return: list with every frame in the block, without the b'\\n'
+    """
+    return block.split(b'\n')[:-1]
+
+
+class FrameClock:
+    # Firmware time stamps come from a 32 bit millisecond counter
+    WRAP = 2 ** 32
+
+    def __init__(self, gap_factor=2.5):
+        """
+        Follows the firmware time_stamp of consecutive frames to get the
+        time elapsed between them and detect problems in the stream.
+
+        :param gap_factor: an interval longer than gap_factor times the
+            usual frame period is a gap, frames were lost in between
+        """
+        self.gap_factor = gap_factor
+        self.reset()
+        return
+
+    def reset(self):
+        self.last = None
+        self.period = None  # running estimate of the frame period (ms)
+        self.reset_counts()
+        return
+
+    def reset_counts(self):
+        self.gaps = 0
+        self.dropped = 0  # frames estimated to be lost in the gaps
+        self.wraps = 0
+        self.resets = 0  # time_stamp went backwards (firmware restart)
+        return
+
+    def step(self, time_stamp, skipped=0):
+        """
+        :param time_stamp: time_stamp of the next frame (ms)
+        :param skipped: frames received after the previous one but
+            deliberately not processed; not counted as dropped
+        :return: ms elapsed since the previous frame, 0 for the first one
+            and after a reset
+        """
+        last = self.last
+        self.last = time_stamp
+        if last is None:
+            return 0.
+        dt = time_stamp - last
+        if dt <= 0:
+            if last - time_stamp > self.WRAP / 2:
+                dt += self.WRAP
+                self.wraps += 1
+            else:
+                if dt < 0:
+                    self.resets += 1
+                return 0.
+        period = self.period
+        frame_dt = dt / (skipped + 1)
+        if period is None:
+            self.period = frame_dt
+        elif frame_dt > self.gap_factor * period:
+            self.gaps += 1
+            self.dropped += max(int(round(dt / period)) - 1 - skipped, 0)
+        else:
+            self.period = period + 0.05 * (frame_dt - period)
+        return dt
+
+    def stats(self):
+        """
+        :rtype: dict
+        """
+        return {'gaps': self.gaps, 'dropped': self.dropped,
+                'wraps': self.wraps, 'resets': self.resets,
+                'period_ms': self.period}
+
+
+class Snapshot(namedtuple('Snapshot', FIELDS + POSE_FIELDS +
+                          ('pose', 'sonar', 'acc', 'light', 'power'))):
+    """
+    Immutable view of one telemetry frame and the pose estimated after it.
+    Besides the raw fields it carries, already converted, the tuples
+    returned by the eBot getters, so reading them allocates nothing:
+
+    - pose: (x, y, heading in degrees)
+    - sonar: rear left, left, front, right, rear right, back, in meters
+    - acc: Ax, Ay, Az, Gx, Gy, Gz minus their offsets
+    - light: (LDR_front, LDR_top)
+    - power: (voltage, current)
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_frame(cls, data, pose, offsets):
+        """
+        :param data: the 20 values of a frame, in FIELDS order
+        :param pose: (x, y, heading)
+        :param offsets: (Ax, Ay, Az, Gx, Gy, Gz) offsets
+        """
+        pose = tuple(pose)
+        sonar = (data[11] / 1000, data[10] / 1000, data[9] / 1000,
+                 data[8] / 1000, data[7] / 1000, data[12] / 1000)
+        acc = tuple([v - o for v, o in zip(data[1:7], offsets)])
+        return cls(*data, *pose, pose, sonar, acc, (data[16], data[15]),
+                   (data[18], data[19]))
+
+
+def parse_frame(frame):
+    """
+    :param frame: one frame as bytes, with or without the trailing b'\n'
+    :rtype: list
+    :return: the 20 values of the frame as floats
+    :raise ValueError: the frame does not hold exactly 20 numbers
+    """
+    values = list(map(float, frame.split(b';')))
+    if len(values) != N_FIELDS:
+        raise ValueError("Expected {} fields, got {}".format(N_FIELDS,
+                                                             len(values)))
+    return values
+
+
+def _parse_ascii(block):
+    """
+    Vectorized parser for blocks of plain decimal numbers ('-', digits and
+    at most one '.'). Fields are walked one character column at a time,
+    accumulating an exact integer mantissa that is divided by a power of
+    ten at the end, so the result is identical to float().
+
+    :return: (N,20) float array, or None if the block holds anything else
+        or a frame does not have exactly 20 fields.
+    """
+    b = np.frombuffer(block, dtype=np.uint8)
+    ends = np.flatnonzero((b == 59) | (b == 10))
+    n = len(ends)
+    if n % N_FIELDS or (b[ends[N_FIELDS - 1::N_FIELDS]] != 10).any() or \
+       (b[ends] == 10).sum() != n // N_FIELDS:
+        return None
+    starts = np.empty_like(ends)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+    neg = b[starts] == 45
+    pos = starts + neg
+    lens = ends - pos
+    w = int(lens.max())
+    if lens.min() < 1 or w > 16:
+        return None
+    mant = np.zeros(n)
+    dotpos = np.full(n, -1, dtype=np.intp)
+    bad = np.zeros(n, dtype=bool)
+    for j in range(w):
+        idx = pos + j
+        live = idx < ends
+        c = b[np.where(live, idx, ends)]  # dead lanes read their separator
+        d = c - np.uint8(48)
+        isd = d < 10
+        isdot = c == 46
+        bad |= live & ~isd & ~isdot
+        if isdot.any():
+            bad |= isdot & (dotpos >= 0)
+            dotpos[isdot] = j
+        mant *= np.where(isd, 10., 1.)
+        mant += np.where(isd, d, 0)
+    has_dot = dotpos >= 0
+    bad |= lens - has_dot < 1
+    if bad.any():
+        return None
+    values = mant / _POW10[np.where(has_dot, lens - dotpos - 1, 0)]
+    values[neg] *= -1
+    return values.reshape(-1, N_FIELDS)
+
+
+def parse_block(block, structured=True):
+    """
+    Parses every frame of a block at once. Malformed frames are skipped.
+
+    :param block: block of frames as returned by FrameReader.pop_block
+    :param structured: if True the result is a structured array with the
+        fields in FIELDS, otherwise a plain (N,20) float array. Both share
+        the same memory.
+    :rtype: numpy.ndarray
+    """
+    values = _parse_ascii(block) if block else None
+    if values is None:
+        rows = []
+        for frame in split_frames(block):
+            try:
+                rows.append(parse_frame(frame))
+            except ValueError:
+                pass
+        values = np.array(rows, dtype=np.float64).reshape(-1, N_FIELDS)
+    if structured:
+        return values.view(FRAME_DTYPE)[:, 0]
+    return values
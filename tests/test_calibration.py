@@ -0,0 +1,66 @@
+"""
+calibration_values takes its reply out of the telemetry stream and never
+mistakes a frame for it.
+"""
+import pytest
+
+from eBotAPI import eBot
+
+# Locator_EKF builds np.matrix attributes whatever its engine
+pytestmark = pytest.mark.filterwarnings(
+    'ignore::PendingDeprecationWarning')
+
+FRAME = (b'123456;812;-64;16388;-45;23;-120;1200;3000;250;800;1500;2000;'
+         b'120;-118;512;300;25;742;35\n')
+REPLY = b'1000;1001;1002;1003;4000;5000;6000;7000;8000;9000\n'
+
+
+class StreamingPort:
+    """
+    Streams telemetry frames on every read and answers "2C" in the middle
+    of them, after `late` more reads.
+    """
+    def __init__(self, late=0):
+        self.late = late
+        self.pending = None
+        self.written = []
+
+    def write(self, message):
+        self.written.append(message)
+        if message == '2C':
+            self.pending = self.late
+        return len(message)
+
+    def read_available(self):
+        if self.pending == 0:
+            self.pending = None
+            return FRAME + REPLY + FRAME
+        if self.pending is not None:
+            self.pending -= 1
+        return FRAME * 2
+
+    def wait_readable(self, timeout):
+        return True
+
+
+def connected_bot(port):
+    bot = eBot(async_commands=False)
+    bot.port = port
+    bot.serialReady = True
+    return bot
+
+
+def test_reply_among_frames():
+    bot = connected_bot(StreamingPort(late=3))
+    values = bot.calibration_values(cached=False)
+    assert values == [1000., 1001., 1002., 1003., 8., 7., 6., 5., 4., 9.]
+    assert bot.port.written == ['2C']
+
+
+def test_replies_are_not_frames():
+    bot = connected_bot(StreamingPort())
+    bot.port.pending = 0
+    rows = bot.read_block()
+    assert len(rows) == 2
+    assert bot.frame_counts['bad'] == 0
+    assert bot.replies.get_nowait() == REPLY.decode().rstrip()
@@ -0,0 +1,75 @@
+"""
+Catching up on blocks of frames must give the same history and pose as
+processing the frames one at a time.
+"""
+import numpy as np
+import pytest
+
+from eBotAPI import eBot
+from eBotAPI.telemetry import parse_frame
+
+# Locator_EKF builds np.matrix attributes whatever its engine
+pytestmark = pytest.mark.filterwarnings(
+    'ignore::PendingDeprecationWarning')
+
+TOLERANCE = 1e-9
+
+
+def frames(n=300, seed=0):
+    """
+    :return: n frames of a robot turning, with jittery sampling and a gap
+        of lost frames in the middle
+    """
+    rng = np.random.default_rng(seed)
+    stamp = 123456
+    out = []
+    for i in range(n):
+        stamp += 10 + int(rng.integers(0, 3)) + (60 if i == n // 2 else 0)
+        gz = int(200 * np.sin(i / 30.) + rng.integers(-20, 20))
+        right = 200 + int(rng.integers(-10, 10))
+        left = 150 + int(rng.integers(-10, 10))
+        out.append(b'%d;812;-64;16388;-45;23;%d;1200;3000;250;800;1500;2000;'
+                   b'%d;%d;512;300;25;742;35\n' % (stamp, gz, right, left))
+    return out
+
+
+class BlockPort:
+    """
+    Stand-in for SafeSerial that returns one block per read.
+    """
+    def __init__(self, blocks):
+        self.blocks = list(blocks)
+
+    def read_available(self):
+        return self.blocks.pop(0) if self.blocks else b''
+
+    def write(self, message):
+        return len(message)
+
+
+def run(blocks, catch_up):
+    bot = eBot(async_commands=False, catch_up=catch_up)
+    bot.apply_offset([parse_frame(frames()[0])])
+    bot.port = BlockPort(blocks)
+    while bot.port.blocks:
+        bot.update_all()
+    return bot
+
+
+@pytest.mark.parametrize('size', [2, 7, 64])
+def test_blocks_match_single_frames(size):
+    data = frames()
+    single = run(data, catch_up=False)
+    blocks = [b''.join(data[i:i + size]) for i in range(0, len(data), size)]
+    batched = run(blocks, catch_up=True)
+    expected, history = single.history(), batched.history()
+    assert len(history) == len(data)
+    for name in history.dtype.names:
+        np.testing.assert_allclose(history[name], expected[name], rtol=0,
+                                   atol=TOLERANCE, err_msg=name)
+    np.testing.assert_allclose(batched.position(), single.position(),
+                               rtol=0, atol=TOLERANCE)
+    stats, expected_stats = batched.frame_stats(), single.frame_stats()
+    for key in ('processed', 'gaps', 'dropped'):
+        assert stats[key] == expected_stats[key]
+    assert stats['gaps'] == 1
@@ -0,0 +1,46 @@
+"""
+Coalescing of the command writer must not reorder commands.
+"""
+from eBotAPI.commands import CommandWriter
+
+
+class RecordingPort:
+    def __init__(self):
+        self.written = []
+
+    def write(self, message):
+        self.written.append(message)
+        return len(message)
+
+
+def written(sends):
+    """
+    Queues every (message, key) before the writer starts, so that all of
+    them are still pending when the next one arrives.
+    """
+    port = RecordingPort()
+    writer = CommandWriter(port, spacing=0.)
+    for message, key in sends:
+        writer.send(message, key)
+    writer.start()
+    writer.stop()
+    return port.written, writer.stats()
+
+
+def test_latest_keyed_command_wins():
+    sent, stats = written([('8w220;220', 'wheels'), ('8w240;240', 'wheels'),
+                           ('8w260;260', 'wheels')])
+    assert sent == ['8w260;260']
+    assert stats['coalesced'] == 2
+
+
+def test_coalescing_keeps_the_order_of_other_commands():
+    sent, stats = written([('8w220;220', 'wheels'), ('2H', None),
+                           ('8w260;260', 'wheels')])
+    assert sent == ['2H', '8w260;260']
+    assert stats['coalesced'] == 1
+
+
+def test_unkeyed_commands_are_all_sent():
+    sent, _ = written([('2L', None), ('2l', None), ('2L', None)])
+    assert sent == ['2L', '2l', '2L']
@@ -0,0 +1,89 @@
+"""
+The 'fast' engine, filter_batch and Locator_EKF_Bank must follow the same
+filter as the reference 'matrix' engine of Locator_EKF.update_state.
+"""
+import numpy as np
+import pytest
+
+from eBotAPI.Locator_EKF import Locator_EKF, Locator_EKF_Bank
+
+TOLERANCE = 1e-9
+# The matrix engine is built on np.matrix
+pytestmark = pytest.mark.filterwarnings(
+    'ignore::PendingDeprecationWarning')
+
+
+def drive(n=500, seed=0):
+    """
+    :return: (N,4) rows of [heading, right speed, left speed, Ts] of a
+        robot driving curves with noisy sensors and jittery sampling
+    """
+    rng = np.random.default_rng(seed)
+    t = np.arange(n)
+    vr = 0.2 + 0.1 * np.sin(t / 40.) + rng.normal(0., 0.01, n)
+    vl = 0.2 - 0.1 * np.sin(t / 40.) + rng.normal(0., 0.01, n)
+    Ts = 0.01 + rng.uniform(0., 0.005, n)
+    heading = np.cumsum(Ts * (vr - vl) / 0.1) + rng.normal(0., 0.02, n)
+    heading = (heading + np.pi) % (2 * np.pi) - np.pi
+    return np.column_stack([heading, vr, vl, Ts])
+
+
+def run(ekf, rows):
+    return np.array([ekf.update_state(row[:3], row[3])
+                     for row in rows.tolist()])
+
+
+def test_fast_matches_matrix():
+    rows = drive()
+    matrix = Locator_EKF((0.5, -0.2), 0.3, engine='matrix')
+    fast = Locator_EKF((0.5, -0.2), 0.3, engine='fast')
+    np.testing.assert_allclose(run(fast, rows), run(matrix, rows),
+                               rtol=0, atol=TOLERANCE)
+    np.testing.assert_allclose(fast.P, matrix.P, rtol=0, atol=TOLERANCE)
+
+
+def test_filter_batch_matches_update_state():
+    rows = drive()
+    for engine in ('matrix', 'fast'):
+        single = Locator_EKF((0., 0.), 0., engine=engine)
+        batch = Locator_EKF((0., 0.), 0., engine=engine)
+        expected = run(single, rows[:300])
+        np.testing.assert_allclose(batch.filter_batch(rows[:300]), expected,
+                                   rtol=0, atol=TOLERANCE)
+        # The filter is left as if update_state had been called per row
+        np.testing.assert_allclose(run(batch, rows[300:]),
+                                   run(single, rows[300:]),
+                                   rtol=0, atol=TOLERANCE)
+        assert isinstance(batch.x, np.matrix) == (engine == 'matrix')
+
+
+def test_smoothed_batch_ends_on_filtered_pose():
+    rows = drive()
+    filtered = Locator_EKF((0., 0.), 0., engine='fast').filter_batch(rows)
+    smoothed = Locator_EKF((0., 0.), 0., engine='fast').filter_batch(
+        rows, smooth=True)
+    np.testing.assert_allclose(smoothed[-1], filtered[-1], rtol=0,
+                               atol=TOLERANCE)
+    assert np.abs(smoothed[:-1] - filtered[:-1]).max() > 0
+
+
+def test_bank_matches_single_filters():
+    runs = [drive(seed=seed) for seed in range(4)]
+    pos = np.array([[0., 0.], [1., 0.], [0., -1.], [2., 2.]])
+    heading = np.array([0., 0.5, -1., 3.])
+    bank = Locator_EKF_Bank(pos, heading)
+    # The last robot misses every third update
+    mask = np.ones((len(runs[0]), 4), dtype=bool)
+    mask[::3, 3] = False
+    poses = []
+    for k in range(len(runs[0])):
+        data = np.array([r[k, :3] for r in runs])
+        Ts = np.array([r[k, 3] for r in runs])
+        poses.append(bank.update_state(data, Ts, mask[k]).copy())
+    poses = np.array(poses)
+    for i, rows in enumerate(runs):
+        ekf = Locator_EKF(pos[i], heading[i], engine='matrix')
+        expected = run(ekf, rows[mask[:, i]])
+        np.testing.assert_allclose(poses[mask[:, i], i], expected, rtol=0,
+                                   atol=TOLERANCE)
+        np.testing.assert_allclose(bank.P[i], ekf.P, rtol=0, atol=TOLERANCE)
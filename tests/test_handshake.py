@@ -0,0 +1,82 @@
+"""
+The handshake moves on with the expected replies and ignores other lines.
+"""
+from importlib import import_module
+from time import sleep
+
+from eBotAPI.eBot import handshake_steps, probe_steps, run_steps
+
+# The package exports the eBot class under the name of its module
+ebot_module = import_module('eBotAPI.eBot')
+
+FRAME = (b'123456;812;-64;16388;-45;23;-120;1200;3000;250;800;1500;2000;'
+         b'120;-118;512;300;25;742;35\n')
+
+
+class ScriptedPort:
+    """
+    Answers every command written with the bytes given for it.
+    """
+    def __init__(self, replies):
+        self.replies = replies
+        self.buffer = b''
+        self.written = []
+
+    def write(self, message):
+        self.written.append(message)
+        self.buffer += self.replies.get(message, b'')
+        return len(message)
+
+    def read_available(self):
+        data = self.buffer
+        self.buffer = b''
+        return data
+
+    def wait_readable(self, timeout):
+        if not self.buffer:
+            sleep(timeout)
+        return bool(self.buffer)
+
+    def flushInput(self):
+        self.buffer = b''
+
+    def flushOutput(self):
+        return
+
+
+def handshake(replies):
+    port = ScriptedPort(replies)
+    times = {}
+    return run_steps(handshake_steps(port, times), port), port, times
+
+
+def test_handshake():
+    ok, port, times = handshake({'<<1E': b'>>1B\n', '<<1O': b'>>\n',
+                                 'F': FRAME})
+    assert ok
+    assert port.written == ['<<1E', '<<1O', 'F']
+    assert set(times) == {'<<1E', '<<1O', 'F'}
+
+
+def test_ack_skips_stray_lines():
+    # e.g. a late answer to the probe, read after the flush
+    ok, port, _ = handshake({'<<1E': b'eBot\n\n>>1B\n', '<<1O': b'>>\n',
+                             'F': FRAME})
+    assert ok
+
+
+def test_missing_ack_fails(monkeypatch):
+    monkeypatch.setattr(ebot_module, 'HANDSHAKE',
+                        (('<<1E', 'ack', 0.1, True),) +
+                        ebot_module.HANDSHAKE[1:])
+    ok, port, times = handshake({'<<1E': b'eBot\n'})
+    assert not ok
+    assert port.written == ['<<1E']
+
+
+def test_probe():
+    port = ScriptedPort({'<<1?': b'eBot\n'})
+    assert run_steps(probe_steps(port), port)
+    port = ScriptedPort({})
+    assert not run_steps(probe_steps(port, strikes=2), port)
+    assert port.written == ['<<1?', '<<1?']
@@ -0,0 +1,67 @@
+"""
+TelemetryHistory queries must return the same window wherever the ring
+buffer happens to wrap.
+"""
+import numpy as np
+import pytest
+
+from eBotAPI.history import TelemetryHistory
+from eBotAPI.telemetry import N_FIELDS
+
+CAPACITY = 8
+
+
+def filled(count, bulk=False):
+    """
+    :return: a history of capacity CAPACITY after count frames whose
+        time_stamp (and first pose value) is their index
+    """
+    history = TelemetryHistory(CAPACITY)
+    frames = np.zeros((count, N_FIELDS))
+    frames[:, 0] = np.arange(count)
+    poses = np.zeros((count, 3))
+    poses[:, 0] = np.arange(count)
+    if bulk:
+        history.extend(frames, poses)
+    else:
+        for frame, pose in zip(frames.tolist(), poses.tolist()):
+            history.append(frame, pose)
+    return history
+
+
+def expected(count, last_n=None, since=None):
+    stamps = list(range(max(count - CAPACITY, 0), count))
+    if last_n is not None:
+        stamps = stamps[len(stamps) - min(last_n, len(stamps)):]
+    if since is not None:
+        stamps = [s for s in stamps if s >= since]
+    return stamps
+
+
+@pytest.mark.parametrize('bulk', [False, True])
+@pytest.mark.parametrize('count', [0, 5, 8, 11, 16, 21])
+@pytest.mark.parametrize('last_n, since', [
+    (None, None), (3, None), (20, None), (0, None),
+    (None, 10), (None, 0), (None, 100), (5, 14), (2, 3)])
+def test_window_is_chronological(count, bulk, last_n, since):
+    history = filled(count, bulk)
+    window = history.history(last_n, since)
+    assert window['time_stamp'].tolist() == expected(count, last_n, since)
+    assert window['x'].tolist() == window['time_stamp'].tolist()
+
+
+def test_full_ring_since():
+    # count is a multiple of the capacity: the oldest frame is at index 0
+    history = filled(2 * CAPACITY)
+    assert history.history(since=10)['time_stamp'].tolist() == \
+        list(range(10, 16))
+    assert history.mean('time_stamp', since=10) == 12.5
+    assert history.min('time_stamp', since=10) == 10
+    assert history.max('time_stamp', last_n=3) == 15
+
+
+def test_clear():
+    history = filled(11)
+    history.clear()
+    assert len(history) == 0
+    assert len(history.history()) == 0
@@ -0,0 +1,119 @@
+"""
+A recorded log replays to the same history, and recording can be stopped
+at any time.
+"""
+import numpy as np
+import pytest
+
+from eBotAPI import eBot
+from eBotAPI.recording import MAGIC, TelemetryLog, TelemetryRecorder, replay
+from eBotAPI.telemetry import parse_frame
+
+# Locator_EKF builds np.matrix attributes whatever its engine
+pytestmark = pytest.mark.filterwarnings(
+    'ignore::PendingDeprecationWarning')
+
+REST = b';812;-64;16388;-45;23;-120;1200;3000;250;800;1500;2000;'
+
+
+def frame(i):
+    """
+    :return: frame i, 10 ms after frame i - 1, with changing wheel speeds
+    """
+    return (b'%d' % (123456 + 10 * i) + REST +
+            b'%d;%d;512;300;25;742;35\n' % (100 + i, -100 + 2 * i))
+
+
+def blocks(n=60):
+    """
+    :return: n frames in blocks of 1 to 4 frames
+    """
+    out = []
+    i = 0
+    while i < n:
+        size = 1 + i % 4
+        out.append(b''.join(frame(k) for k in range(i, min(i + size, n))))
+        i += size
+    return out
+
+
+class BlockPort:
+    """
+    Stand-in for SafeSerial that returns one block per read.
+    """
+    def __init__(self, blocks, on_read=None):
+        self.blocks = list(blocks)
+        self.on_read = on_read
+
+    def read_available(self):
+        if self.on_read is not None:
+            self.on_read()
+        return self.blocks.pop(0) if self.blocks else b''
+
+    def write(self, message):
+        return len(message)
+
+
+def offline_bot(port=None):
+    bot = eBot(async_commands=False)
+    bot.catch_up = True
+    bot.apply_offset([parse_frame(frame(0))])
+    bot.port = port
+    return bot
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / 'run.log')
+    live = offline_bot(BlockPort(blocks()))
+    live.start_recording(path)
+    while live.port.blocks:
+        live.update_all()
+    live.stop_recording()
+    with TelemetryLog(path) as log:
+        assert [f for _, f in log] == [frame(i).rstrip() for i in range(60)]
+        assert [b for _, b in log.blocks()] == blocks()
+    replayed = offline_bot()
+    assert replay(replayed, path) == 60
+    assert replayed.history().tobytes() == live.history().tobytes()
+    assert replayed.position() == live.position()
+
+
+def test_truncated_last_record(tmp_path):
+    path = str(tmp_path / 'run.log')
+    recorder = TelemetryRecorder(path)
+    recorder.write_block(frame(0) + frame(1), host_time=1.)
+    recorder.close()
+    with open(path, 'rb') as f:
+        data = f.read()
+    # Cut inside the last frame, then inside the header of a new record
+    for size in (len(data) - 3, len(data) + 5):
+        with open(path, 'wb') as f:
+            f.write((data + data[len(MAGIC):])[:size])
+        with TelemetryLog(path) as log:
+            frames = [f for _, f in log]
+        expected = 1 if size < len(data) else 2
+        assert frames == [frame(i).rstrip() for i in range(expected)]
+
+
+def test_write_after_close_is_ignored(tmp_path):
+    path = str(tmp_path / 'run.log')
+    recorder = TelemetryRecorder(path)
+    recorder.write_block(frame(0))
+    recorder.close()
+    recorder.write_block(frame(1))
+    assert recorder.frames == 1
+    with TelemetryLog(path) as log:
+        assert len(list(log)) == 1
+
+
+def test_stop_recording_during_read(tmp_path):
+    path = str(tmp_path / 'run.log')
+    bot = offline_bot()
+    bot.port = BlockPort(blocks(10), on_read=bot.stop_recording)
+    bot.start_recording(path)
+    bot.update_all()
+    assert bot.recorder is None
+    assert len(bot.history()) == 1
+    with TelemetryLog(path) as log:
+        assert list(log) == []
+    assert np.isfinite(bot.position()).all()
@@ -0,0 +1,87 @@
+"""
+A reader attached to the shared segment sees what the owner published,
+in order, across wraparounds of the ring.
+"""
+import platform
+import uuid
+
+import numpy as np
+import pytest
+
+from eBotAPI.sharing import TSO_MACHINES, SharedTelemetry
+from eBotAPI.telemetry import N_FIELDS
+
+pytestmark = pytest.mark.skipif(
+    platform.machine().lower() not in TSO_MACHINES,
+    reason="shared telemetry needs an x86 CPU")
+
+CAPACITY = 8
+OFFSETS = (1., 2., 3., 4., 5., 6.)
+
+
+def frame(i):
+    """
+    :return: frame i, whose time_stamp is i
+    """
+    return [float(i)] + [0.] * (N_FIELDS - 1)
+
+
+def pose(i):
+    return (float(i), -float(i), 0.5 * i)
+
+
+@pytest.fixture
+def segment():
+    owner = SharedTelemetry.create('ebot-test-' + uuid.uuid4().hex[:12],
+                                   CAPACITY)
+    reader = SharedTelemetry.attach(owner.name)
+    yield owner, reader
+    reader.close()
+    owner.close()
+
+
+def test_empty(segment):
+    owner, reader = segment
+    assert reader.count == 0
+    assert reader.latest() is None
+    assert reader.pose() is None
+    assert len(reader.history()) == 0
+
+
+@pytest.mark.parametrize('block', [1, 3, 20])
+def test_order_past_capacity(segment, block):
+    owner, reader = segment
+    total = 2 * CAPACITY + 5
+    for i in range(0, total, block):
+        ids = range(i, min(i + block, total))
+        if block == 1:
+            owner.publish(frame(i), pose(i), OFFSETS)
+        else:
+            owner.publish_block([frame(k) for k in ids],
+                                [pose(k) for k in ids], OFFSETS)
+    assert reader.count == total
+    record, offsets = reader.latest()
+    assert record['time_stamp'] == total - 1
+    assert offsets == OFFSETS
+    assert reader.pose() == pose(total - 1)
+    assert reader.snapshot().pose == pose(total - 1)
+    assert reader.history()['time_stamp'].tolist() == \
+        list(range(total - CAPACITY, total))
+    history = reader.history(3)
+    assert history['time_stamp'].tolist() == [total - 3, total - 2,
+                                              total - 1]
+    np.testing.assert_array_equal(history['x'], history['time_stamp'])
+
+
+def test_closed_after_owner_closes(segment):
+    owner, reader = segment
+    owner.publish(frame(0), pose(0), OFFSETS)
+    assert not reader.closed
+    owner.close()
+    assert reader.closed
+    assert reader.wait(reader.count, timeout=1.) is None
+    # The reader keeps its mapping until it closes
+    assert reader.pose() == pose(0)
+    # Publishing after close does nothing
+    owner.publish(frame(1), pose(1), OFFSETS)
+    assert reader.count == 1
@@ -0,0 +1,149 @@
+"""
+parse_frame and parse_block must give exactly the values of float(), and
+FrameClock must account for every frame of the stream.
+"""
+import numpy as np
+import pytest
+
+from eBotAPI.telemetry import N_FIELDS, FrameClock, _parse_ascii, \
+    parse_block, parse_frame
+
+FRAME = (b'123456;812;-64;16388;-45;23;-120;1200;3000;250;800;1500;2000;'
+         b'120;-118;512;300;25;742;35\n')
+# FRAME without its time_stamp, to build frames with another first field
+REST = FRAME[FRAME.index(b';'):]
+
+
+def reference(block):
+    return np.array([[float(v) for v in frame.split(b';')]
+                     for frame in block.splitlines()]).reshape(-1, N_FIELDS)
+
+
+def random_block(n=200, seed=0):
+    """
+    Frames of integers and decimals of every width the vectorized parser
+    accepts, signed and unsigned.
+    """
+    rng = np.random.default_rng(seed)
+    frames = []
+    for i in range(n):
+        values = []
+        for j in range(N_FIELDS):
+            digits = str(rng.integers(0, 10 ** rng.integers(1, 16)))
+            kind = rng.integers(0, 4)
+            if kind == 1:
+                at = rng.integers(0, len(digits) + 1)
+                digits = digits[:at] + '.' + digits[at:]
+                if digits in ('.', ''):
+                    digits = '0'
+            elif kind == 2:
+                digits = digits + '.'
+            if rng.integers(0, 2):
+                digits = '-' + digits
+            values.append(digits)
+        frames.append(';'.join(values))
+    return ('\n'.join(frames) + '\n').encode()
+
+
+def test_parse_frame_matches_float():
+    assert parse_frame(FRAME) == [float(v) for v in FRAME.split(b';')]
+    assert parse_frame(FRAME.rstrip()) == parse_frame(FRAME)
+
+
+def test_parse_frame_rejects_wrong_field_count():
+    with pytest.raises(ValueError):
+        parse_frame(b'1;2;3\n')
+
+
+def test_parse_ascii_is_bit_identical_to_float():
+    block = random_block()
+    values = _parse_ascii(block)
+    assert values is not None
+    expected = reference(block)
+    # Exact equality, including the sign of -0.
+    assert values.tobytes() == expected.tobytes()
+
+
+@pytest.mark.parametrize('frame', [
+    b'1e3' + REST,                 # exponent
+    b'+1' + REST,                  # explicit sign
+    b'1.2.3' + REST,               # two dots
+    b'12345678901234567' + REST,   # more than 16 characters
+    b' 12' + REST,                 # blank
+    b'-' + REST,                   # sign only
+])
+def test_parse_ascii_declines_other_syntax(frame):
+    assert _parse_ascii(FRAME + frame) is None
+
+
+def test_parse_block_falls_back_to_float():
+    block = FRAME + b'1e3' + REST + b'+2' + REST + FRAME
+    values = parse_block(block, structured=False)
+    assert values.tobytes() == reference(block).tobytes()
+
+
+def test_parse_block_skips_malformed_frames():
+    block = FRAME + b'1;2;3\n' + b'x' + REST + FRAME
+    values = parse_block(block, structured=False)
+    assert values.tobytes() == reference(FRAME + FRAME).tobytes()
+    structured = parse_block(block)
+    assert structured['time_stamp'].tolist() == [123456., 123456.]
+
+
+def test_parse_block_empty():
+    assert parse_block(b'', structured=False).shape == (0, N_FIELDS)
+
+
+def test_clock_steady_stream():
+    clock = FrameClock()
+    assert [clock.step(t) for t in (1000, 1010, 1020, 1030)] == \
+        [0., 10., 10., 10.]
+    assert clock.stats() == {'gaps': 0, 'dropped': 0, 'wraps': 0,
+                             'resets': 0, 'period_ms': 10.}
+
+
+def test_clock_wraps_around():
+    clock = FrameClock()
+    start = FrameClock.WRAP - 15
+    assert clock.step(start) == 0.
+    assert clock.step(start + 10) == 10.
+    assert clock.step(5) == 10.
+    stats = clock.stats()
+    assert stats['wraps'] == 1
+    assert stats['gaps'] == stats['resets'] == 0
+
+
+def test_clock_counts_dropped_frames():
+    clock = FrameClock()
+    for t in (1000, 1010, 1020):
+        clock.step(t)
+    # Four frames lost between 1020 and 1070
+    assert clock.step(1070) == 50.
+    # Frames read but skipped on purpose are not dropped
+    assert clock.step(1100, skipped=2) == 30.
+    stats = clock.stats()
+    assert stats['gaps'] == 1
+    assert stats['dropped'] == 4
+    assert stats['period_ms'] == 10.
+
+
+def test_clock_firmware_restart():
+    clock = FrameClock()
+    for t in (5000, 5010):
+        clock.step(t)
+    assert clock.step(20) == 0.
+    assert clock.step(30) == 10.
+    assert clock.stats()['resets'] == 1
+
+
+def test_clock_reset():
+    clock = FrameClock()
+    for t in (1000, 1010, 1100):
+        clock.step(t)
+    clock.reset()
+    assert clock.stats() == {'gaps': 0, 'dropped': 0, 'wraps': 0,
+                             'resets': 0, 'period_ms': None}
+    # A new session starts from its own first time stamp
+    assert clock.step(500000) == 0.
+    assert clock.step(500010) == 10.
+    assert clock.stats()['gaps'] == 0